@@ -14,6 +14,7 @@ import      csv
 
 # System dependency imports
 import      pydicom             as      dicom
+from        pydicom.dataelem    import  RawDataElement
 import      pylab
 import      matplotlib.cm       as      cm
 
@@ -24,6 +25,74 @@ import      inspect
 
 import      pudb
 import      hashlib
+import      zipfile
+import      tarfile
+import      mmap
+import      socket
+import      socketserver
+import      http.server
+import      urllib.request
+import      concurrent.futures
+import      ctypes
+import      ctypes.util
+import      select
+import      struct
+import      sqlite3
+import      fcntl
+import      threading
+import      functools
+import      signal
+import      errno
+import      gzip
+import      bz2
+import      lzma
+import      io
+import      contextlib
+import      array
+import      collections.abc
+import      itertools
+try:
+    import  zstandard
+except ImportError:
+    zstandard   = None
+try:
+    import  orjson
+except ImportError:
+    orjson      = None
+
+class pflog(object):
+    """
+    A thin layer over a pfmisc.debug object that checks the level
+    before any message is built. pfmisc.debug.qprint() formats its
+    message (and walks the call stack) whatever the verbosity, so in
+    the hot loops call
+
+        self.dlog('Saved report file: %s', str_fileName)
+        self.dlog(lambda: "\n" + self.pp.pformat(l_filesHere))
+
+    where the message is only formatted (or the callable only called)
+    if it is going to be shown.
+    """
+
+    def __init__(self, **kwargs):
+        self.dp             = None
+        self.verbosityLevel = -1
+
+        for key, value in kwargs.items():
+            if key == 'debug':      self.dp             = value
+            if key == 'verbosity':  self.verbosityLevel = int(value)
+
+    def enabled(self, level = 1):
+        return level <= self.verbosityLevel
+
+    def __call__(self, msg, *args, level = 1, **kwargs):
+        if level > self.verbosityLevel:
+            return
+        if callable(msg):
+            msg     = msg()
+        elif args:
+            msg     = msg % args
+        self.dp.qprint(msg, level = level, stackDepth = 2, **kwargs)
 
 class pftree(object):
     """
@@ -101,6 +170,22 @@ class pftree(object):
         # Flags
         self.b_persistAnalysisResults   = False
 
+        # Sharding -- process only the series in shard <shardIndex>
+        # of <shardCount>
+        self.shardIndex                 = 0
+        self.shardCount                 = 1
+
+        # If the input is an archive, the (normalized) member names
+        # that constitute the virtual input tree, in archive order
+        self.l_archiveMember            = None
+
+        # An optional callback that decides, during the walk, whether
+        # a file is admitted to the input tree
+        self.fn_fileFilter              = None
+
+        # Progress reporting, possibly shared with the containing object
+        self.progress                   = None
+
         self.dp                         = None
         self.log                        = None
         self.tic_start                  = 0.0
@@ -117,7 +202,12 @@ class pftree(object):
             if key == "inputDir":           self.str_inputDir           = value
             if key == "inputFile":          self.str_inputFile          = value
             if key == "outputDir":          self.str_outputDir          = value
+            if key == 'shardIndex':         self.shardIndex             = int(value)
+            if key == 'shardCount':         self.shardCount             = int(value)
+            if key == 'archiveMembers':     self.l_archiveMember        = value
+            if key == 'fileFilter':         self.fn_fileFilter          = value
             if key == 'verbosity':          self.verbosityLevel         = int(value)
+            if key == 'progress':           self.progress               = value
 
         # Set logging
         self.dp                        = pfmisc.debug(    
@@ -125,22 +215,69 @@ class pftree(object):
                                             level       = 0,
                                             within      = self.__name__
                                             )
+        self.dlog                      = pflog(
+                                            debug       = self.dp,
+                                            verbosity   = self.verbosityLevel
+                                            )
         self.log                       = pfmisc.Message()
         self.log.syslog(True)
+        if self.progress is None:
+            self.progress               = pfprogress(verbosity = self.verbosityLevel)
 
         try:
             if not len(self.str_inputDir): self.str_inputDir = '.'
         except:
             self.dp.qprint("input directory not specified.", comms = 'error')
 
+    @staticmethod
+    def shard_of(str_path, shardCount):
+        """
+        Deterministically map a series <str_path> to a shard in the
+        range [0, shardCount).
+
+        The python builtin hash() is salted per process, so an md5 of
+        the normalized path is used instead -- this way every node
+        in a job array agrees on the assignment without any
+        coordination.
+        """
+        str_path    = os.path.normpath(str_path)
+        str_digest  = hashlib.md5(str_path.encode('utf-8')).hexdigest()
+        return int(str_digest[:16], 16) % shardCount
+
+    def archive_walk(self, str_topDir):
+        """
+        An os.walk() work-alike over the member names of an input
+        archive, yielding (root, dirs, files) for each virtual
+        directory under <str_topDir>.
+
+        The directories are yielded in the order of their first
+        member in the archive (and those without members after them),
+        so that a compressed tar is read front to back rather than
+        seeking backwards and decompressing again.
+        """
+        d_dir   = {}
+        l_order = []
+        for str_member in self.l_archiveMember:
+            str_dir, str_file   = os.path.split(str_member)
+            if str_dir not in d_dir or not d_dir[str_dir][1]:
+                l_order.append(str_dir)
+            d_dir.setdefault(str_dir, [set(), []])[1].append(str_file)
+            while len(str_dir):
+                str_parent, str_sub = os.path.split(str_dir)
+                d_dir.setdefault(str_parent, [set(), []])[0].add(str_sub)
+                str_dir             = str_parent
+        s_order = set(l_order)
+        l_order += sorted(d for d in d_dir if d not in s_order)
+        for str_dir in l_order:
+            str_root    = os.path.join(str_topDir, str_dir) if len(str_dir) \
+                          else str_topDir
+            yield str_root, sorted(d_dir[str_dir][0]), d_dir[str_dir][1]
+
     def simpleProgress_show(self, index, total, *args):
-        str_pretext = ""
+        str_stage   = ""
         if len(args):
-            str_pretext = args[0] + ":"
-        f_percent   = index/total*100
-        str_num     = "[%3d/%3d: %5.2f%%] " % (index, total, f_percent)
-        str_bar     = "*" * int(f_percent)
-        self.dp.qprint("%s%s%s" % (str_pretext, str_num, str_bar))
+            str_stage   = args[0]
+        self.progress.update(index, total, str_stage)
 
     def tree_probe(self, **kwargs):
         """
@@ -148,6 +285,13 @@ class pftree(object):
         a **kwargs identified 'root', and return lists of files and 
         directories found.
 
+        If the tree was constructed with 'archiveMembers', then the
+        member names of the archive are walked instead of the file
+        system.
+
+        If the tree was constructed with a 'fileFilter' callback, only
+        the files for which the callback returns True are kept.
+
         kwargs:
             root    = '/some/path'
 
@@ -170,36 +314,145 @@ class pftree(object):
         for k, v in kwargs.items():
             if k == 'root':  str_topDir  = v
 
-        for root, dirs, files in os.walk(str_topDir):
+        if self.l_archiveMember is not None:
+            fn_walk     = self.archive_walk
+        else:
+            fn_walk     = os.walk
+
+        for root, dirs, files in fn_walk(str_topDir):
             b_status = True
             str_path = root.split(os.sep)
             if dirs:
                 l_dirsHere = [root + '/' + x for x in dirs]
                 l_dirs.append(l_dirsHere)
-                self.dp.qprint('Appending dirs to search space:\n')
-                self.dp.qprint("\n" + self.pp.pformat(l_dirsHere))
+                self.dlog('Appending dirs to search space:\n')
+                self.dlog(lambda: "\n" + self.pp.pformat(l_dirsHere))
             if files:
-                l_filesHere = [root + '/' + y for y in files]
-                if len(self.str_inputFile):
-                    l_hit = [s for s in l_filesHere if self.str_inputFile in s]
-                    if l_hit: 
-                        l_filesHere = l_hit
-                    else:
-                        l_filesHere = []
+                l_filesHere = self.files_filter(root, files)
                 if l_filesHere:
                     l_files.append(l_filesHere)
-                self.dp.qprint('Appending files to search space:\n')
-                self.dp.qprint("\n" + self.pp.pformat(l_filesHere))
+                self.dlog('Appending files to search space:\n')
+                self.dlog(lambda: "\n" + self.pp.pformat(l_filesHere))
         return {
             'status':   True,
             'l_dir':    l_dirs,
             'l_files':  l_files
         }
 
+    def files_filter(self, root, files):
+        """
+        Return the list of <files> in directory <root> (as paths) that
+        pass the <inputFile> and (optional) fileFilter checks.
+        """
+        l_filesHere = [root + '/' + y for y in files]
+        if len(self.str_inputFile):
+            l_hit = [s for s in l_filesHere if self.str_inputFile in s]
+            if l_hit: 
+                l_filesHere = l_hit
+            else:
+                l_filesHere = []
+        if self.fn_fileFilter:
+            l_filesHere = [s for s in l_filesHere if self.fn_fileFilter(s)]
+        return l_filesHere
+
+    def tree_walk(self, **kwargs):
+        """
+        A lazy alternative to tree_probe() + tree_construct(): walk
+        down from a **kwargs identified 'root' and yield
+
+            (<path>, <list of files in path>)
+
+        for each (non-empty, in-shard) directory as it is reached,
+        without building the whole tree in memory.
+        """
+        str_topDir  = "."
+        for k, v in kwargs.items():
+            if k == 'root':  str_topDir  = v
+
+        if self.l_archiveMember is not None:
+            fn_walk     = self.archive_walk
+        else:
+            fn_walk     = os.walk
+
+        for root, dirs, files in fn_walk(str_topDir):
+            l_filesHere = self.files_filter(root, files)
+            if not l_filesHere:
+                continue
+            if self.shardCount > 1 and \
+               self.shard_of(os.path.relpath(root, str_topDir),
+                             self.shardCount) != self.shardIndex:
+                continue
+            yield root, l_filesHere
+
+    def tree_read(self, **kwargs):
+        """
+        An alternative to tree_probe() + tree_construct() when the
+        files are already known: build the input tree directly from
+        a **kwargs identified 'files' iterable of paths (of the form
+        './<dir>/<file>', like those of the walk), grouping them by
+        directory. Nothing is walked or stat'ed.
+
+        The files are consumed as a stream; a directory's names are
+        packed into a pffilelist as soon as the stream moves on from
+        it (a directory that recurs later is merged). Out of shard
+        directories and files failing the <inputFile> and fileFilter
+        checks are dropped as they are read, so only the admitted
+        files are ever held.
+        """
+        it_file     = []
+        for k, v in kwargs.items():
+            if k == 'files':    it_file     = v
+
+        d_shard     = {}
+        l_current   = [None, []]
+        d_count     = {'files': 0}
+
+        def current_add():
+            str_dir, l_name = l_current
+            l_current[:]    = [None, []]
+            if str_dir is None:
+                return
+            if len(self.str_inputFile) or self.fn_fileFilter:
+                l_name      = [os.path.basename(f) for f in
+                               self.files_filter(str_dir, l_name)]
+            if not l_name:
+                return
+            d_count['files']   += len(l_name)
+            if str_dir in self.d_inputTree:
+                l_name      = self.d_inputTree[str_dir].names() + l_name
+            self.d_inputTree[str_dir]   = pffilelist(str_dir, l_name)
+            self.d_outputTree[str_dir]  = ""
+
+        def shard_admit(str_dir):
+            if self.shardCount == 1:
+                return True
+            if str_dir not in d_shard:
+                d_shard[str_dir]    = self.shard_of(str_dir, self.shardCount) \
+                                      == self.shardIndex
+            return d_shard[str_dir]
+
+        for str_file in it_file:
+            str_dir, str_name   = os.path.split(str_file)
+            if str_dir != l_current[0]:
+                current_add()
+                if not shard_admit(str_dir):
+                    continue
+                l_current[0]    = str_dir
+            l_current[1].append(str_name)
+        current_add()
+        return {
+            'status':   True,
+            'files':    d_count['files'],
+            'dirs':     len(self.d_inputTree)
+        }
+
     def tree_construct(self, *args, **kwargs):
         """
         Processes the <l_files> list of files from the tree_probe()
         and builds the input/output dictionary structures.
+
+        If the tree is sharded (i.e. self.shardCount > 1), then only
+        the series paths that hash to self.shardIndex are added.
         """
         l_files = []
         for k, v in kwargs.items():
@@ -209,6 +462,10 @@ class pftree(object):
         for l_series in l_files:
             str_path    = os.path.dirname(l_series[0])
             self.simpleProgress_show(index, total, 'tree_construct')
+            if self.shardCount > 1 and \
+               self.shard_of(str_path, self.shardCount) != self.shardIndex:
+                index += 1
+                continue
             # self.dp.qprint("Creating path:      %s" % str_path)
             # self.dp.qprint("Adding filelist:    %s" % l_series)
             self.d_inputTree[str_path]  = l_series
@@ -226,6 +483,7 @@ class pftree(object):
 
             analysiscallback        = self.fn_filterFileList
             outputcallback          = self.fn_outputprocess
+            filtercallback          = self.fn_filterSeries
             applyResultsTo          = 'inputTree'|'outputTree'
             applyKey                = <arbitrary key in analysis dictionary>
             persistAnalysisResults  = True|False
@@ -292,16 +550,27 @@ class pftree(object):
         is called on the dictionary result of the analysiscallback method. The 
         result of this outputcallback is saved to the <outputTree> instead.
 
+        Lastly, if a
+
+            kwargs:     filtercallback      = self.fn_filterSeries
+
+        is passed, it is called on the file list at each path before any
+        analysis. If it returns False, the path is skipped entirely (no
+        analysis and no output callback).
+
         """
         str_applyResultsTo          = ""
         str_applyKey                = ""
         fn_analysiscallback         = None
         fn_outputcallback           = None
+        fn_filtercallback           = None
         b_persistAnalysisResults    = False
         d_tree                      = self.d_outputTree
+        filtered                    = 0
         for k, v in kwargs.items():
             if k == 'analysiscallback':         fn_analysiscallback         = v
             if k == 'outputcallback':           fn_outputcallback           = v
+            if k == 'filtercallback':           fn_filtercallback           = v
             if k == 'applyResultsTo':           str_applyResultsTo          = v
             if k == 'applyKey':                 str_applyKey                = v
             if k == 'persistAnalysisResults':   b_persistAnalysisResults    = v
@@ -313,6 +582,11 @@ class pftree(object):
         total   = len(self.d_inputTree.keys())
         for path, data in self.d_inputTree.items():
             self.simpleProgress_show(index, total, fn_analysiscallback.__name__)
+            if fn_filtercallback and not fn_filtercallback(data):
+                filtered += 1
+                index    += 1
+                continue
+            self.progress.count(files = len(data))
             # self.dp.qprint("Analyzing files in: %s" % path)
             d_analysis          = fn_analysiscallback(data, **kwargs)
             if len(str_applyKey):
@@ -320,13 +594,13 @@ class pftree(object):
             else:
                 d_tree[path]    = d_analysis
             if fn_outputcallback:
-                self.simpleProgress_show(index, total, fn_outputcallback.__name__)
                 d_output        = fn_outputcallback(d_analysis, **kwargs)
             if not b_persistAnalysisResults:
                 d_tree[path]    = d_output
             index += 1
         return {
-            'status':   True
+            'status':   True,
+            'filtered': filtered
         }
 
     def tree_analysisOutput(self, *args, **kwargs):
@@ -344,12 +618,142 @@ class pftree(object):
         total   = len(self.d_inputTree.keys())
         for path, d_analysis in self.d_outputTree.items():
             self.simpleProgress_show(index, total)
-            self.dp.qprint("Processing analysis results in output: %s" % path)
+            self.dlog("Processing analysis results in output: %s", path)
             d_output        = fn_outputcallback(d_analysis, **kwargs)
         return {
             'status':   True
         }
 
+class pffilelist(collections.abc.Sequence):
+    """
+    A compact, read-only list of the files of one directory, for
+    input trees of tens of millions of files: the names are held in
+    a single NUL joined string with an array of their offsets (a
+    few bytes of overhead per file, rather than a str object each),
+    and the paths are only built as they are accessed.
+    """
+
+    __slots__   = ('str_dir', 'str_names', 'a_offset')
+
+    def __init__(self, str_dir, l_name):
+        self.str_dir    = str_dir
+        self.str_names  = '\0'.join(l_name)
+        self.a_offset   = array.array('L', [0])
+        self.a_offset.extend(itertools.accumulate(len(n) + 1 for n in l_name))
+
+    def __len__(self):
+        return len(self.a_offset) - 1
+
+    def name(self, index):
+        return self.str_names[self.a_offset[index]:self.a_offset[index + 1] - 1]
+
+    def names(self):
+        return self.str_names.split('\0') if len(self) else []
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index  += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('pffilelist index out of range')
+        return self.str_dir + '/' + self.name(index)
+
+    def __repr__(self):
+        return 'pffilelist(%r, %d files)' % (self.str_dir, len(self))
+
+class pfprogress(object):
+    """
+    A progress reporter for the tree loops that updates at most <rate>
+    times a second. On a TTY it redraws a single status line (on
+    stderr) with the series, files and bytes rates and an ETA; when
+    not attached to a TTY it logs a structured 'key=value' line every
+    <logInterval> seconds instead.
+
+    Below verbosity 1 it is disabled, and update() and count() return
+    after a single attribute test.
+    """
+
+    def __init__(self, **kwargs):
+        self.verbosityLevel = -1
+        self.rate           = 4.0
+        self.logInterval    = 10.0
+        self.stream         = sys.stderr
+        self.__name__       = 'pfprogress'
+
+        for key, value in kwargs.items():
+            if key == 'verbosity':      self.verbosityLevel = int(value)
+            if key == 'rate':           self.rate           = float(value)
+            if key == 'logInterval':    self.logInterval    = float(value)
+            if key == 'stream':         self.stream         = value
+
+        self.b_enabled      = self.verbosityLevel >= 1
+        self.b_tty          = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.f_interval     = 1.0 / self.rate if self.b_tty else self.logInterval
+        self.str_stage      = None
+        self.stage_reset('')
+        self.dp             = pfmisc.debug(
+                                verbosity   = self.verbosityLevel,
+                                level       = 0,
+                                within      = self.__name__
+                                )
+
+    def stage_reset(self, str_stage):
+        self.str_stage      = str_stage
+        self.f_start        = time.monotonic()
+        self.f_last         = self.f_start
+        self.files          = 0
+        self.bytes          = 0
+
+    def count(self, files = 0, bytes = 0):
+        """
+        Add to the files and bytes processed in the current stage.
+        """
+        if not self.b_enabled:
+            return
+        self.files         += files
+        self.bytes         += bytes
+
+    @staticmethod
+    def human(value, str_unit = ''):
+        for str_prefix in ('', 'k', 'M', 'G', 'T'):
+            if abs(value) < 1000:
+                break
+            value  /= 1000.0
+        return '%.1f%s%s' % (value, str_prefix, str_unit)
+
+    def update(self, index, total, str_stage = ''):
+        """
+        Note that <index> of the <total> series of <str_stage> are
+        done, and show the progress if it is time to.
+        """
+        if not self.b_enabled:
+            return
+        if str_stage != self.str_stage:
+            self.stage_reset(str_stage)
+        f_now       = time.monotonic()
+        b_done      = index >= total
+        if not b_done and f_now - self.f_last < self.f_interval:
+            return
+        self.f_last = f_now
+        f_elapsed   = max(f_now - self.f_start, 1e-9)
+        f_series    = index / f_elapsed
+        f_eta       = (total - index) / f_series if f_series else 0.0
+        if self.b_tty:
+            str_line = '%-20s [%d/%d %5.1f%%] %s series/s %s files/s %s ETA %ds' % (
+                        str_stage[:20], index, total,
+                        100.0 * index / total if total else 100.0,
+                        self.human(f_series), self.human(self.files / f_elapsed),
+                        self.human(self.bytes / f_elapsed, 'B/s'), f_eta)
+            self.stream.write('\r' + str_line + ('\n' if b_done else ''))
+            self.stream.flush()
+        else:
+            self.dp.qprint('progress stage=%s done=%d total=%d '
+                           'series_s=%.2f files_s=%.2f bytes_s=%.0f eta_s=%.0f' % (
+                            str_stage, index, total, f_series,
+                            self.files / f_elapsed, self.bytes / f_elapsed, f_eta),
+                           level = 1)
+
 class pfdicom(object):
 
     """
@@ -411,10 +815,90 @@ class pfdicom(object):
             if key == 'default':    return "Elapsed time = %f seconds." % f_elapsedTime
         return f_elapsedTime
 
+    def report(     self,
+                    astr_key,
+                    ab_exitToOs=1,
+                    astr_header=""
+                    ):
+        '''
+        Error handling.
+
+        Based on the <astr_key>, error information is extracted from
+        _dictErr and sent to log object.
+
+        If <ab_exitToOs> is False, error is considered non-fatal and
+        processing can continue, otherwise processing terminates.
+
+        '''
+        log         = self.log
+        b_syslog    = log.syslog()
+        log.syslog(False)
+        if ab_exitToOs: log( Colors.RED +    "\n:: FATAL ERROR :: " + Colors.NO_COLOUR )
+        else:           log( Colors.YELLOW + "\n::   WARNING   :: " + Colors.NO_COLOUR )
+        if len(astr_header): log( Colors.BROWN + astr_header + Colors.NO_COLOUR )
+        log( "\n" )
+        log( "\tSorry, some error seems to have occurred in:\n\t<" )
+        log( Colors.LIGHT_GREEN + ("%s" % self.name()) + Colors.NO_COLOUR + "::")
+        log( Colors.LIGHT_CYAN + ("%s" % inspect.stack()[2][4][0].strip()) + Colors.NO_COLOUR)
+        log( "> called by <")
+        try:
+            caller = inspect.stack()[3][4][0].strip()
+        except:
+            caller = '__main__'
+        log( Colors.LIGHT_GREEN + ("%s" % self.name()) + Colors.NO_COLOUR + "::")
+        log( Colors.LIGHT_CYAN + ("%s" % caller) + Colors.NO_COLOUR)
+        log( ">\n")
+        log( "\tWhile %s\n" % self._dictErr[astr_key]['action'] )
+        log( "\t%s\n" % self._dictErr[astr_key]['error'] )
+        log( "\n" )
+        if ab_exitToOs:
+            log( "Returning to system with error code %d\n" % \
+                            self._dictErr[astr_key]['exitCode'] )
+            sys.exit( self._dictErr[astr_key]['exitCode'] )
+        log.syslog(b_syslog)
+        return self._dictErr[astr_key]['exitCode']
+
+    def fatal( self, astr_key, astr_extraMsg="" ):
+        '''
+        Convenience dispatcher to the error_exit() method.
+
+        Will raise "fatal" error, i.e. terminate script.
+        '''
+        b_exitToOS  = True
+        self.report(  astr_key, b_exitToOS, astr_extraMsg )
+
+    def warn( self, astr_key, astr_extraMsg="" ):
+        '''
+        Convenience dispatcher to the error_exit() method.
+
+        Will raise "warning" error, i.e. script processing continues.
+        '''
+        b_exitToOS = False
+        self.report( astr_key, b_exitToOS, astr_extraMsg )
+
+    def name(self, *args):
+        '''
+        get/set the descriptive name text of this object.
+        '''
+        if len(args):
+            self.__name__ = args[0]
+        else:
+            return self.__name__
+
     def declare_selfvars(self):
         """
         A block to declare self variables
         """
+        self._dictErr = {
+            'inputDirFail'   : {
+                'action'        : 'trying to check on the input directory, ',
+                'error'         : 'directory not found. This is a *required* input',
+                'exitCode'      : 1},
+            'inputArchiveFail'  : {
+                'action'        : 'trying to open the input archive, ',
+                'error'         : 'input is a file, but not a zip or tar archive',
+                'exitCode'      : 2}
+            }
 
         #
         # Object desc block
@@ -428,6 +912,24 @@ class pfdicom(object):
         self.str_inputFile              = ''
         self.str_extension              = ''
 
+        # Archive input -- the open zip/tar object and a map of
+        # normalized member names to their ZipInfo/TarInfo
+        self.archive                    = None
+        self.d_archiveMember            = {}
+
+        # Sniffed input -- files were vetted by DICOMfile_sniff(), and
+        # so are read even if they lack the preamble and file meta
+        self.b_sniff                    = False
+
+        # Memory mapped reads -- headers are parsed from the map, and
+        # uncompressed PixelData is viewed in place
+        self.b_mmap                     = False
+        self.mmap                       = None
+        self.mmapDeferSize              = 16384
+
+        # I/O rate limits (a pfthrottle), if any
+        self.throttle                   = None
+
         self.str_stdout                 = ''
         self.str_stderr                 = ''
         self.exitCode                   = 0
@@ -468,6 +970,8 @@ class pfdicom(object):
             if key == "inputDir":           self.str_inputDir          = value
             if key == "inputFile":          self.str_inputFile         = value
             if key == "extension":          self.str_extension         = value
+            if key == 'mmap':               self.b_mmap                = bool(value)
+            if key == 'sniff':              self.b_sniff               = bool(value)
             if key == 'verbosity':          self.verbosityLevel         = int(value)
 
         # Set logging
@@ -485,6 +989,111 @@ class pfdicom(object):
             self.dp.qprint("input directory not specified.", comms = 'error')
             self.fatal('inputDirFail')
 
+    @staticmethod
+    def archiveMember_normalize(str_name):
+        """
+        Normalize an archive member name (or a virtual input tree
+        path) to a plain relative path, i.e. without any leading
+        './' or '/'.
+        """
+        str_name    = os.path.normpath(str_name)
+        if str_name == '.':
+            return ''
+        return str_name.lstrip('/')
+
+    def archive_open(self, str_archive):
+        """
+        Open a zip or tar (optionally compressed) <str_archive> as
+        the input tree.
+        """
+        b_status    = False
+        if zipfile.is_zipfile(str_archive):
+            self.archive            = zipfile.ZipFile(str_archive)
+            self.d_archiveMember    = {
+                self.archiveMember_normalize(info.filename): info
+                for info in self.archive.infolist() if not info.is_dir()
+            }
+            b_status                = True
+        elif tarfile.is_tarfile(str_archive):
+            self.archive            = tarfile.open(str_archive, 'r:*')
+            self.d_archiveMember    = {
+                self.archiveMember_normalize(info.name): info
+                for info in self.archive.getmembers() if info.isfile()
+            }
+            b_status                = True
+        return {
+            'status':   b_status,
+            'archive':  str_archive,
+            'members':  len(self.d_archiveMember)
+        }
+
+    def file_open(self, str_file):
+        """
+        Open <str_file> for binary reading. If the input is an
+        archive, <str_file> is a path in the virtual input tree,
+        and the corresponding member is streamed from the archive
+        without being unpacked to disk.
+        """
+        if self.archive is None:
+            return open(str_file, 'rb')
+        info    = self.d_archiveMember[self.archiveMember_normalize(str_file)]
+        if isinstance(self.archive, zipfile.ZipFile):
+            return self.archive.open(info)
+        return self.archive.extractfile(info)
+
+    def file_size(self, str_file):
+        """
+        The size in bytes of <str_file> (or of the archive member).
+        """
+        if self.archive is None:
+            try:
+                return os.path.getsize(str_file)
+            except OSError:
+                return 0
+        info    = self.d_archiveMember.get(self.archiveMember_normalize(str_file))
+        if isinstance(info, zipfile.ZipInfo):
+            return info.file_size
+        return info.size if info is not None else 0
+
+    # The value representations of DICOM PS3.5, used to recognize
+    # explicit VR encoded files that lack the preamble
+    _s_VR = frozenset([
+        b'AE', b'AS', b'AT', b'CS', b'DA', b'DS', b'DT', b'FD', b'FL',
+        b'IS', b'LO', b'LT', b'OB', b'OD', b'OF', b'OL', b'OV', b'OW',
+        b'PN', b'SH', b'SL', b'SQ', b'SS', b'ST', b'SV', b'TM', b'UC',
+        b'UI', b'UL', b'UN', b'UR', b'US', b'UT', b'UV'
+    ])
+
+    def DICOMfile_sniff(self, str_file):
+        """
+        A cheap check on whether <str_file> is a DICOM file, reading
+        only its first 132 bytes.
+
+        Files with the 128 byte preamble are recognized by the 'DICM'
+        magic. For (older) files without a preamble, the first bytes
+        must look like a data element in one of the low groups, with
+        either a valid explicit VR (little or big endian), or a
+        plausible implicit VR little endian length.
+        """
+        try:
+            with self.file_open(str_file) as fp:
+                header  = fp.read(132)
+        except (OSError, KeyError):
+            return False
+        if len(header) == 132 and header[128:132] == b'DICM':
+            return True
+        if len(header) < 8:
+            return False
+        b_explicitVR    = header[4:6] in self._s_VR
+        if int.from_bytes(header[0:2], 'big') == 0x0008:
+            return b_explicitVR
+        if int.from_bytes(header[0:2], 'little') not in (0x0002, 0x0008):
+            return False
+        if b_explicitVR:
+            return True
+        length          = int.from_bytes(header[4:8], 'little')
+        return length < 0x10000 and length % 2 == 0
+
     def DICOMfile_read(self, *args, **kwargs):
         b_status        = False
 
@@ -497,9 +1106,40 @@ class pfdicom(object):
 
         str_localFile   = os.path.basename(str_file)
         str_path        = os.path.dirname(str_file)
-        self.dcm        = dicom.read_file(str_file)
-        self.d_dcm      = dict(self.dcm)
-        self.strRaw     = str(self.dcm)
+        self.mmap_close()
+        if self.throttle is not None:
+            self.throttle.acquire(files = 1, bytes = self.file_size(str_file))
+            f_start     = time.monotonic()
+        if self.archive is None and self.b_mmap:
+            self.dcm    = self.DICOMfile_mmap(str_file)
+        elif self.archive is None:
+            self.dcm    = dicom.read_file(str_file, force = self.b_sniff)
+        else:
+            # Archive members are streamed straight into pydicom;
+            # pixel data is only pulled through the stream if an
+            # image is to be created from it.
+            with self.file_open(str_file) as fp:
+                self.dcm    = dicom.read_file(
+                                fp,
+                                stop_before_pixels = not self.pixelData_needed(),
+                                force              = self.b_sniff
+                            )
+        if not self.datasetCopy_needed():
+            # Elements (and sequence items) are then only decoded when
+            # they are actually accessed.
+            self.d_dcm  = {}
+            self.strRaw = ''
+        elif self.mmap is None:
+            self.d_dcm  = dict(self.dcm)
+            self.strRaw = str(self.dcm)
+        else:
+            # Converting the whole dataset would pull the deferred
+            # PixelData out of the map, so leave it out here.
+            self.d_dcm  = {tag: self.dcm[tag] for tag in self.dcm.keys()
+                           if tag != 0x7FE00010}
+            self.strRaw = str(dicom.Dataset(self.d_dcm))
+        if self.throttle is not None:
+            self.throttle.latency_add(time.monotonic() - f_start)
         self.l_tagRaw   = self.dcm.dir()
         return {
             'status':   b_status,
@@ -507,82 +1147,1264 @@ class pfdicom(object):
             'path':     str_path
         }
 
-class pfdicom_tag(pfdicom):
-    """
-    A class based on the 'pfdicom' infrastructure that extracts 
-    and processes DICOM tags according to several requirements.
-    """
+    def pixelData_needed(self):
+        """
+        Whether the PixelData of a read is required downstream. The
+        base class has no such consumers.
+        """
+        return False
 
-    def declare_selfvars(self):
+    def datasetCopy_needed(self):
         """
-        A block to declare self variables
+        Whether DICOMfile_read() should fill <d_dcm> and <strRaw> with
+        a fully decoded copy of the dataset.
         """
-        self._dictErr = {
-            'imageFileSpecFail'   : {
-                'action'        : 'trying to parse image file specified, ',
-                'error'         : 'wrong format found. Must be [<index>:]<filename>',
-                'exitCode'      : 1},
-            'inputTAGLISTFileFail': {
-                'action'        : 'trying to read input <tagFileList>, ',
-                'error'         : 'could not access/read file -- does it exist? Do you have permission?',
-                'exitCode'      : 20
-                }
-            }
+        return True
 
-        #
-        # Object desc block
-        #
-        self.str_desc                  = ''
-        self.__name__                  = "pfdicom_tag"
+    def DICOMfile_mmap(self, str_file):
+        """
+        Parse the DICOM <str_file> from a read-only memory map.
 
-        # Directory and filenames
-        # self.str_workingDir            = ''
-        self.str_inputDir              = ''
-        self.str_inputFile             = ''
-        # self.str_extension             = ''
-        # self.str_fileIndex             = ''
-        # self.l_inputDirTree            = []
-        self.str_outputFileStem        = ''
-        self.str_outputFileType        = ''
-        # self.l_outputFileType          = []
-        self.str_outputDir             = ''
-        # self.d_outputTree              = {}
+        Large elements (in particular the PixelData) are deferred,
+        so that their values are never copied unless accessed. Many
+        workers reading the same file share the page cache rather
+        than each holding a private buffered copy.
+        """
+        with open(str_file, 'rb') as f:
+            self.mmap   = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        return dicom.read_file(self.mmap,
+                               defer_size   = self.mmapDeferSize,
+                               force        = self.b_sniff)
 
-        self.str_stdout                = ''
-        self.str_stderr                = ''
-        self.exitCode                  = 0
+    def mmap_close(self):
+        """
+        Close the memory map of the previous read, unless a pixel
+        view of it is still in use (the map is then released along
+        with the view).
+        """
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass
+        self.mmap   = None
+
+    def pixelArray_view(self, dcm):
+        """
+        Return a zero-copy numpy view of the uncompressed PixelData
+        of <dcm> in the current memory map, shaped as pydicom's
+        pixel_array would be, or None if the PixelData cannot be
+        viewed in place (compressed, not deferred, no map, etc).
+        """
+        if self.mmap is None or dcm is None:
+            return None
+        # Dataset.get_item() would resolve the deferred read, so look
+        # for the raw element amongst the (unconverted) values.
+        elem    = None
+        for value in reversed(dcm.values()):
+            if value.tag == 0x7FE00010:
+                elem    = value
+                break
+        if not isinstance(elem, RawDataElement) or elem.value is not None:
+            return None
+        if elem.length == 0xFFFFFFFF:
+            # encapsulated, i.e. compressed, pixel data
+            return None
+        try:
+            bits        = int(dcm.BitsAllocated)
+            rows        = int(dcm.Rows)
+            cols        = int(dcm.Columns)
+            samples     = int(dcm.get('SamplesPerPixel', 1))
+            frames      = int(dcm.get('NumberOfFrames', 1) or 1)
+            planar      = int(dcm.get('PlanarConfiguration', 0))
+            signed      = int(dcm.get('PixelRepresentation', 0))
+            stored      = int(dcm.get('BitsStored', bits) or bits)
+        except (AttributeError, TypeError, ValueError):
+            return None
+        if bits not in (8, 16, 32, 64):
+            return None
+        if signed and stored < bits:
+            # The sign bit has to be extended into the unused high
+            # bits, which pydicom's pixel_array does
+            return None
+        dtype       = np.dtype('%s%s%d' % (
+                            '<' if elem.is_little_endian else '>',
+                            'i' if signed else 'u',
+                            bits // 8))
+        count       = frames * rows * cols * samples
+        if count * dtype.itemsize > elem.length:
+            return None
+        arr         = np.frombuffer(self.mmap,
+                                    dtype   = dtype,
+                                    count   = count,
+                                    offset  = elem.value_tell)
+        if samples == 1:
+            arr     = arr.reshape(frames, rows, cols)
+        elif planar == 0:
+            arr     = arr.reshape(frames, rows, cols, samples)
+        else:
+            arr     = arr.reshape(frames, samples, rows, cols).transpose(0, 2, 3, 1)
+        if frames == 1:
+            arr     = arr[0]
+        return arr
 
-        # The actual data volume and slice
-        # are numpy ndarrays
-        # self.dcm                       = None
-        # self.str_outputFormat          = ''
-        # self.l_tagRaw                  = []     # tag list
-        # self.d_dcm                     = {}     # dict convert of raw dcm
-        # Following are filtered by tagList
-        self.d_dicom                   = {}     # values directly from dcm ojbect
-        self.d_dicomSimple             = {}     # formatted dict convert
+    def pixelArray_get(self, dcm):
+        """
+        Return the pixel array of <dcm>, as a view over the memory
+        map if possible, otherwise via pydicom.
+        """
+        arr     = self.pixelArray_view(dcm)
+        if arr is None:
+            arr = dcm.pixel_array
+        return arr
 
-        # String representations of different outputFormats
-        self.strRaw                    = ''
-        self.str_json                  = ''
-        self.str_dict                  = ''
-        self.str_col                   = ''
-        self.str_raw                   = ''
+class pfwatch(object):
+    """
+    Report the directories below a <root> in which files were created,
+    moved in, or written. Uses Linux inotify (through ctypes, so no
+    extra dependency) and falls back to polling the directory
+    modification times where inotify is not available.
+    """
 
-        # Image conversion
-        self.b_convertToImg            = False
-        self.str_outputImageFile       = ''
-        self.str_imageIndex            = ''
+    IN_MODIFY       = 0x00000002
+    IN_CLOSE_WRITE  = 0x00000008
+    IN_MOVED_TO     = 0x00000080
+    IN_CREATE       = 0x00000100
+    IN_Q_OVERFLOW   = 0x00004000
+    IN_ISDIR        = 0x40000000
 
-        # Tags
-        self.b_tagList                 = False
-        self.b_tagFile                 = False
+    def __init__(self, **kwargs):
+        self.str_root       = '.'
+        self.f_poll         = 10.0
+        self.verbosityLevel = -1
+        self.__name__       = 'pfwatch'
+        self.fd             = -1
+        self.libc           = None
+        self.d_wd           = {}        # inotify watch descriptor -> dir
+        self.d_mtime        = {}        # polling: dir -> mtime
+
+        for key, value in kwargs.items():
+            if key == 'root':       self.str_root       = value
+            if key == 'poll':       self.f_poll         = float(value)
+            if key == 'verbosity':  self.verbosityLevel = int(value)
+
+        self.dp             = pfmisc.debug(
+                                verbosity   = self.verbosityLevel,
+                                level       = 0,
+                                within      = self.__name__
+                                )
+        try:
+            self.libc       = ctypes.CDLL(ctypes.util.find_library('c'),
+                                          use_errno = True)
+            self.fd         = self.libc.inotify_init()
+        except (OSError, AttributeError, TypeError):
+            self.fd         = -1
+        if self.fd >= 0:
+            self.dp.qprint('Watching %s with inotify' % self.str_root)
+        else:
+            self.dp.qprint('Watching %s by polling' % self.str_root)
+        self.tree_add(self.str_root)
+
+    def tree_add(self, str_dir):
+        """
+        Start watching <str_dir> and every directory below it, and
+        return the list of those directories.
+        """
+        l_dir   = [root for root, dirs, files in os.walk(str_dir)]
+        for str_sub in l_dir:
+            if self.fd >= 0:
+                mask    = self.IN_CREATE | self.IN_MOVED_TO | \
+                          self.IN_CLOSE_WRITE | self.IN_MODIFY
+                wd      = self.libc.inotify_add_watch(self.fd,
+                                                      str_sub.encode(), mask)
+                if wd >= 0:
+                    self.d_wd[wd]   = str_sub
+            else:
+                try:
+                    self.d_mtime[str_sub] = os.stat(str_sub).st_mtime
+                except OSError:
+                    pass
+        return l_dir
+
+    def changes_wait(self, f_timeout):
+        """
+        Wait up to <f_timeout> seconds, and return the set of
+        directories that changed in the meantime.
+        """
+        if self.fd >= 0:
+            return self.inotify_read(f_timeout)
+        time.sleep(f_timeout)
+        return self.poll()
+
+    def inotify_read(self, f_timeout):
+        s_dir       = set()
+        l_ready, _, _ = select.select([self.fd], [], [], f_timeout)
+        if not l_ready:
+            return s_dir
+        buf         = os.read(self.fd, 65536)
+        pos         = 0
+        while pos + 16 <= len(buf):
+            wd, mask, cookie, length = struct.unpack_from('iIII', buf, pos)
+            str_name    = buf[pos + 16 : pos + 16 + length].rstrip(b'\0').decode()
+            pos        += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost -- treat the whole tree as changed
+                s_dir.update(self.d_wd.values())
+                continue
+            str_dir     = self.d_wd.get(wd)
+            if str_dir is None:
+                continue
+            if mask & self.IN_ISDIR:
+                # A new directory, possibly already populated
+                s_dir.update(self.tree_add(os.path.join(str_dir, str_name)))
+            else:
+                s_dir.add(str_dir)
+        return s_dir
+
+    def poll(self):
+        s_dir       = set()
+        for str_dir, f_mtime in list(self.d_mtime.items()):
+            try:
+                f_now   = os.stat(str_dir).st_mtime
+            except OSError:
+                del self.d_mtime[str_dir]
+                continue
+            if f_now != f_mtime:
+                self.d_mtime[str_dir]   = f_now
+                s_dir.add(str_dir)
+                for entry in os.scandir(str_dir):
+                    if entry.is_dir() and entry.path not in self.d_mtime:
+                        s_dir.update(self.tree_add(entry.path))
+        return s_dir
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class pftagpath(object):
+    """
+    A path to a (possibly nested or private) data element, compiled
+    once and then evaluated directly on each dataset, so that only the
+    sequence items along the path are decoded. A path is a '.'
+    separated list of steps, each one of
+
+        <keyword>                       e.g. RepetitionTime
+        <gggg><eeee>                    a hex tag, e.g. 00191000
+        <gggg>{<creator>}<ee>           a private element by creator and
+                                        offset, e.g. 0029{SIEMENS CSA HEADER}10
+
+    optionally followed by '[<index>]' to select a sequence item, for
+    example
+
+        SharedFunctionalGroupsSequence[0].MRTimingAndRelatedParametersSequence[0].RepetitionTime
+
+    A sequence step without an index selects its first item.
+    """
+
+    _reStep = re.compile(r"""(?:
+                (?:0x)?(?P<hex>[0-9A-Fa-f]{8})                      |
+                (?P<group>[0-9A-Fa-f]{4})\{(?P<creator>[^}]*)\}
+                                       (?P<offset>[0-9A-Fa-f]{2})   |
+                (?P<keyword>[A-Za-z][A-Za-z0-9]*)
+            )(?:\[(?P<index>\d+)\])?(?:\.|$)""", re.VERBOSE)
+
+    def __init__(self, str_path):
+        self.str_path   = str_path
+        self.l_step     = []
+        pos             = 0
+        while pos < len(str_path):
+            match = self._reStep.match(str_path, pos)
+            if not match or match.end() == pos:
+                raise ValueError("cannot parse tag path at '%s'" % \
+                                 str_path[pos:])
+            pos   = match.end()
+            index = int(match.group('index')) if match.group('index') else None
+            if match.group('hex') is not None:
+                self.l_step.append((int(match.group('hex'), 16), None, index))
+            elif match.group('creator') is not None:
+                self.l_step.append((int(match.group('group'), 16),
+                                    (match.group('creator'),
+                                     int(match.group('offset'), 16)),
+                                    index))
+            else:
+                tag = dicom.datadict.tag_for_keyword(match.group('keyword'))
+                if tag is None:
+                    raise ValueError("unknown tag '%s' in tag path" % \
+                                     match.group('keyword'))
+                self.l_step.append((tag, None, index))
+        if not len(self.l_step) or str_path.endswith('.'):
+            raise ValueError("empty step in tag path '%s'" % str_path)
+
+    @staticmethod
+    def is_path(str_tag):
+        """
+        Whether <str_tag> needs compiling, i.e. is not a plain keyword.
+        """
+        return len(str_tag) > 0 and \
+               not re.match(r'[A-Za-z][A-Za-z0-9]*$', str_tag)
+
+    def keyword(self):
+        """
+        The keyword of the top level element of the path (or '' for a
+        private or unknown top level tag).
+        """
+        tag, t_private, index = self.l_step[0]
+        if t_private is not None:
+            return ''
+        return dicom.datadict.keyword_for_tag(tag)
+
+    def element(self, ds):
+        """
+        The data element at the end of the path in the dataset <ds>.
+        Raises KeyError if any step along the path is missing.
+        """
+        elem    = None
+        for i, (tag, t_private, index) in enumerate(self.l_step):
+            if t_private is not None:
+                elem    = ds.private_block(tag, t_private[0])[t_private[1]]
+            else:
+                elem    = ds[tag]
+            if i == len(self.l_step) - 1:
+                break
+            if elem.VR != 'SQ':
+                raise KeyError(self.str_path)
+            try:
+                ds      = elem.value[index or 0]
+            except IndexError:
+                raise KeyError(self.str_path)
+        return elem
+
+    def value(self, ds, default = None):
+        """
+        The value at the end of the path in <ds>, or <default>.
+        """
+        try:
+            return self.element(ds).value
+        except KeyError:
+            return default
+
+class pfprefetch(object):
+    """
+    Read ahead the files that are about to be processed, from a
+    background thread, so that storage latency hides behind the
+    parsing of the current file.
+
+    The thread stays at most <ahead> files in front of the consumer
+    (which calls advance() per file, or uses a callback wrapped with
+    wrap()), and only asks for the first <bytes> of each file -- the
+    header region, so that PixelData is not pulled in (0 prefetches
+    whole files). At most <ahead> * <bytes> of page cache is thus
+    claimed at any time. Where posix_fadvise() is available, the
+    kernel is advised with WILLNEED, otherwise the region is read and
+    discarded.
+    """
+
+    def __init__(self, **kwargs):
+        self.l_file         = []
+        self.ahead          = 4
+        self.bytes          = 65536
+        self.consumed       = 0
+        self.b_stop         = False
+        self.cond           = threading.Condition()
+        self.thread         = None
+
+        for key, value in kwargs.items():
+            if key == 'files':      self.l_file         = list(value)
+            if key == 'ahead':      self.ahead          = int(value)
+            if key == 'bytes':      self.bytes          = int(value)
+
+    def start(self):
+        self.thread         = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        for i, str_file in enumerate(self.l_file):
+            with self.cond:
+                while not self.b_stop and i >= self.consumed + self.ahead:
+                    self.cond.wait()
+                if self.b_stop:
+                    return
+            self.file_prefetch(str_file)
+
+    def file_prefetch(self, str_file):
+        try:
+            fd  = os.open(str_file, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, self.bytes, os.POSIX_FADV_WILLNEED)
+            else:
+                remaining   = self.bytes or os.fstat(fd).st_size
+                while remaining > 0 and os.read(fd, min(remaining, 1 << 20)):
+                    remaining  -= 1 << 20
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def advance(self):
+        """
+        Note that the consumer has moved on to the next file.
+        """
+        with self.cond:
+            self.consumed  += 1
+            self.cond.notify()
+
+    def wrap(self, fn_callback):
+        """
+        Wrap a per-file <fn_callback> so that each call advances the
+        read-ahead window.
+        """
+        @functools.wraps(fn_callback)
+        def fn_advancing(*args, **kwargs):
+            self.advance()
+            return fn_callback(*args, **kwargs)
+        return fn_advancing
+
+    def stop(self):
+        with self.cond:
+            self.b_stop     = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+class pfthrottle(object):
+    """
+    Token bucket rate limits on the I/O of a run, so that a long run
+    holds a shared file server to a predictable load instead of
+    reading in unthrottled bursts.
+
+    Each I/O first calls acquire() with its file and byte count; it
+    sleeps as needed to keep at most <files> files/s and <bytes>
+    bytes/s (0 is no limit), with bursts of up to one second's worth.
+
+    In adaptive mode, the latency of each read is passed to
+    latency_add(). A smoothed latency well above the lowest one seen
+    (by <latencyFactor>) means the server is loaded, and the rates
+    are halved, down to <scaleMin> of the limits; otherwise they
+    recover additively, about once per second. Without a <files>
+    limit, adaptive mode sets one at the file rate observed when the
+    server first appears loaded.
+    """
+
+    def __init__(self, **kwargs):
+        self.filesPerSec    = 0.0
+        self.bytesPerSec    = 0.0
+        self.b_adaptive     = False
+        self.latencyFactor  = 2.0
+        self.scale          = 1.0
+        self.scaleMin       = 0.05
+        self.lock           = threading.Lock()
+
+        for key, value in kwargs.items():
+            if key == 'files':          self.filesPerSec    = float(value)
+            if key == 'bytes':          self.bytesPerSec    = float(value)
+            if key == 'adaptive':       self.b_adaptive     = bool(value)
+            if key == 'latencyFactor':  self.latencyFactor  = float(value)
+
+        f_now               = time.monotonic()
+        self.f_tokens       = [self.filesPerSec, self.bytesPerSec]
+        self.f_last         = f_now
+        self.latency        = None
+        self.latencyMin     = None
+        self.f_adjust       = f_now
+        self.files          = 0
+        self.f_start        = f_now
+        self.waited         = 0.0
+
+    def acquire(self, files = 1, bytes = 0):
+        """
+        Take <files> and <bytes> from the buckets, sleeping until
+        they are available. The buckets may go into debt for a large
+        request, which is then paid back by the next wait.
+        """
+        with self.lock:
+            f_now           = time.monotonic()
+            f_elapsed       = f_now - self.f_last
+            self.f_last     = f_now
+            self.files     += files
+            f_wait          = 0.0
+            for i, (rate, amount) in enumerate(zip(
+                    (self.filesPerSec, self.bytesPerSec), (files, bytes))):
+                if rate <= 0:
+                    continue
+                rate       *= self.scale
+                self.f_tokens[i]    = min(self.f_tokens[i] + f_elapsed * rate,
+                                          rate) - amount
+                if self.f_tokens[i] < 0:
+                    f_wait  = max(f_wait, -self.f_tokens[i] / rate)
+            self.waited    += f_wait
+        if f_wait > 0:
+            time.sleep(f_wait)
+
+    def latency_add(self, f_latency):
+        """
+        Note the latency of a read, and adapt the rates to it.
+        """
+        if not self.b_adaptive:
+            return
+        with self.lock:
+            self.latency    = f_latency if self.latency is None else \
+                              0.8 * self.latency + 0.2 * f_latency
+            if self.latencyMin is None or self.latency < self.latencyMin:
+                self.latencyMin = self.latency
+            f_now           = time.monotonic()
+            if f_now - self.f_adjust < 1.0:
+                return
+            self.f_adjust   = f_now
+            if self.latency > self.latencyFactor * self.latencyMin:
+                if self.filesPerSec <= 0:
+                    self.filesPerSec    = max(1.0,
+                                    self.files / max(f_now - self.f_start, 1e-3))
+                    self.f_tokens[0]    = self.filesPerSec
+                self.scale  = max(self.scaleMin, self.scale / 2)
+            else:
+                self.scale  = min(1.0, self.scale + 0.1)
+
+    def summary(self):
+        return 'throttle: %d files, %.1f s waited, rate scale %.2f' % (
+                    self.files, self.waited, self.scale)
+
+class pfquery(object):
+    """
+    A small predicate language over DICOM header tags, compiled once
+    and then evaluated on each dataset, for example:
+
+        Modality == 'MR' and SeriesDescription ~ 'T1'
+        StudyDate >= 20200101 and not (Manufacturer ~ 'GE')
+
+    Each comparison is '<tag> <op> <literal>' with <op> one of
+
+        ==, !=, <, <=, >, >=    comparison
+        ~                       regular expression search
+
+    and comparisons combine with 'and', 'or', 'not' and parentheses.
+    A <tag> can also be a keyword path into sequence items, as in
+    the tag lists (see pftagpath).
+    A number literal makes the comparison numeric; a quoted literal
+    makes it a string comparison. A comparison on a multi-valued
+    element holds if it holds for any of its values, and a comparison
+    on a missing tag never holds.
+
+    The tags referenced are in <l_tag>, so that only those need to be
+    read from a file before evaluation.
+    """
+
+    _reToken = re.compile(r"""\s*(?:
+                (?P<num>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)           |
+                '(?P<sq>[^']*)'                                     |
+                "(?P<dq>[^"]*)"                                     |
+                (?P<op>==|!=|<=|>=|<|>|~|\(|\))                     |
+                (?P<name>[A-Za-z][\w.\[\]]*)
+            )""", re.VERBOSE)
+
+    _d_op = {
+        '==':   lambda a, b: a == b,
+        '!=':   lambda a, b: a != b,
+        '<':    lambda a, b: a <  b,
+        '<=':   lambda a, b: a <= b,
+        '>':    lambda a, b: a >  b,
+        '>=':   lambda a, b: a >= b
+    }
+
+    def __init__(self, str_where):
+        self.str_where  = str_where
+        self.l_tag      = []
+        self.d_path     = {}
+        self.l_token    = self.tokenize(str_where)
+        self.pos        = 0
+        self.fn_match   = self.parse_or()
+        if self.pos != len(self.l_token):
+            raise ValueError("unexpected '%s' in where clause" % \
+                             self.l_token[self.pos][1])
+
+    def tokenize(self, str_where):
+        l_token = []
+        pos     = 0
+        str_where = str_where.rstrip()
+        while pos < len(str_where):
+            match = self._reToken.match(str_where, pos)
+            if not match:
+                raise ValueError("cannot parse where clause at '%s'" % \
+                                 str_where[pos:])
+            pos   = match.end()
+            if match.group('num') is not None:
+                l_token.append(('literal', float(match.group('num'))))
+            elif match.group('sq') is not None:
+                l_token.append(('literal', match.group('sq')))
+            elif match.group('dq') is not None:
+                l_token.append(('literal', match.group('dq')))
+            elif match.group('op') is not None:
+                l_token.append(('op', match.group('op')))
+            elif match.group('name') in ('and', 'or', 'not'):
+                l_token.append((match.group('name'), match.group('name')))
+            else:
+                l_token.append(('tag', match.group('name')))
+        return l_token
+
+    def token_next(self, *al_kind):
+        if self.pos >= len(self.l_token):
+            raise ValueError("where clause ends unexpectedly")
+        token = self.l_token[self.pos]
+        if al_kind and token[0] not in al_kind:
+            raise ValueError("unexpected '%s' in where clause" % token[1])
+        self.pos += 1
+        return token
+
+    def token_peek(self):
+        if self.pos < len(self.l_token):
+            return self.l_token[self.pos]
+        return (None, None)
+
+    def parse_or(self):
+        l_fn    = [self.parse_and()]
+        while self.token_peek()[0] == 'or':
+            self.token_next()
+            l_fn.append(self.parse_and())
+        if len(l_fn) == 1:
+            return l_fn[0]
+        return lambda ds: any(fn(ds) for fn in l_fn)
+
+    def parse_and(self):
+        l_fn    = [self.parse_not()]
+        while self.token_peek()[0] == 'and':
+            self.token_next()
+            l_fn.append(self.parse_not())
+        if len(l_fn) == 1:
+            return l_fn[0]
+        return lambda ds: all(fn(ds) for fn in l_fn)
+
+    def parse_not(self):
+        if self.token_peek()[0] == 'not':
+            self.token_next()
+            fn  = self.parse_not()
+            return lambda ds: not fn(ds)
+        if self.token_peek() == ('op', '('):
+            self.token_next()
+            fn  = self.parse_or()
+            self.token_next('op')
+            if self.l_token[self.pos - 1][1] != ')':
+                raise ValueError("expected ')' in where clause")
+            return fn
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        str_tag = self.token_next('tag')[1]
+        if pftagpath.is_path(str_tag):
+            self.d_path[str_tag] = pftagpath(str_tag)
+            str_read    = self.d_path[str_tag].keyword()
+        elif dicom.datadict.tag_for_keyword(str_tag) is None:
+            raise ValueError("unknown tag '%s' in where clause" % str_tag)
+        else:
+            str_read    = str_tag
+        str_op  = self.token_next('op')[1]
+        literal = self.token_next('literal')[1]
+        if str_op == '~':
+            re_literal  = re.compile(str(literal))
+            fn_test     = lambda v: bool(re_literal.search(str(v)))
+        elif str_op in self._d_op:
+            fn_op       = self._d_op[str_op]
+            if isinstance(literal, float):
+                def fn_test(v):
+                    try:
+                        return fn_op(float(v), literal)
+                    except (TypeError, ValueError):
+                        return False
+            else:
+                fn_test = lambda v: fn_op(str(v).strip(), literal)
+        else:
+            raise ValueError("unexpected '%s' in where clause" % str_op)
+        if str_read not in self.l_tag:
+            self.l_tag.append(str_read)
+
+        def fn_compare(ds):
+            value = self.value_get(ds, str_tag)
+            if value is None:
+                return False
+            if isinstance(value, (list, tuple, dicom.multival.MultiValue)):
+                return any(fn_test(v) for v in value)
+            return fn_test(value)
+        return fn_compare
+
+    def value_get(self, ds, str_tag):
+        """
+        The value of <str_tag> in the dataset <ds>, or None if absent.
+        """
+        if str_tag in self.d_path:
+            return self.d_path[str_tag].value(ds)
+        return getattr(ds, str_tag, None)
+
+    def match(self, ds):
+        """
+        Evaluate the compiled predicate on the dataset <ds>.
+        """
+        return self.fn_match(ds)
+
+class pfcolumns(object):
+    """
+    A columnar store of the tags of all the series of a run: one
+    compact column per tag, filled a row (series) at a time.
+
+    A column holding only numbers is a typed array of doubles (NaN
+    where the tag is missing); any other column is dictionary
+    encoded, i.e. an array of integer codes into a list of the
+    distinct (string) values, with code 0 for missing. A numeric
+    column that meets a non-numeric value is turned into a string
+    column. Multi-valued elements are stored as '\\' joined strings.
+
+    The columns can be filtered with select(), grouped with
+    group_by(), and exported with save() (csv, json or npz).
+    """
+
+    def __init__(self):
+        self.rows           = 0
+        self.d_column       = {}
+
+    def __len__(self):
+        return self.rows
+
+    @staticmethod
+    def value_normalize(value):
+        if value is None or (isinstance(value, str) and value == 'no attribute'):
+            return None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        if isinstance(value, (list, tuple, dicom.multival.MultiValue)):
+            return '\\'.join(str(v) for v in value)
+        return str(value)
+
+    def column_new(self):
+        return {
+            'kind':     'num',
+            'b_int':    True,
+            'data':     array.array('d', [float('nan')] * self.rows),
+            'l_value':  [None],
+            'd_code':   {}
+        }
+
+    def column_toString(self, d_column):
+        a_code      = array.array('I')
+        for f in d_column['data']:
+            a_code.append(0 if f != f else self.code_get(d_column, repr(f)
+                                                         if f != int(f) else str(int(f))))
+        d_column['kind']    = 'str'
+        d_column['data']    = a_code
+
+    @staticmethod
+    def code_get(d_column, str_value):
+        code    = d_column['d_code'].get(str_value)
+        if code is None:
+            code    = len(d_column['l_value'])
+            d_column['d_code'][str_value]   = code
+            d_column['l_value'].append(str_value)
+        return code
+
+    def append(self, d_row):
+        """
+        Add a row of {<tag>: <value>}. Tags not seen before get a new
+        column (missing for the earlier rows), and columns not in
+        <d_row> are missing for this one.
+        """
+        for tag in d_row:
+            if tag not in self.d_column:
+                self.d_column[tag]  = self.column_new()
+        for tag, d_column in self.d_column.items():
+            value   = self.value_normalize(d_row.get(tag))
+            if d_column['kind'] == 'num':
+                if value is None:
+                    d_column['data'].append(float('nan'))
+                    continue
+                if not isinstance(value, str):
+                    if not isinstance(value, int):
+                        d_column['b_int']   = False
+                    d_column['data'].append(float(value))
+                    continue
+                self.column_toString(d_column)
+            d_column['data'].append(0 if value is None else
+                                    self.code_get(d_column, str(value)))
+        self.rows  += 1
+        return self.rows - 1
+
+    def column(self, tag):
+        """
+        The values of <tag>, as a numpy array of floats for a numeric
+        column, else as a list of strings (None where missing).
+        """
+        d_column    = self.d_column[tag]
+        if d_column['kind'] == 'num':
+            return np.frombuffer(d_column['data'], dtype = np.float64)
+        l_value     = d_column['l_value']
+        return [l_value[c] for c in d_column['data']]
+
+    def select(self, tag, fn_test):
+        """
+        The indices of the rows whose <tag> passes <fn_test>. For a
+        numeric column, <fn_test> is applied once to the whole numpy
+        array and must return a boolean mask; for a string column, it
+        is called once per distinct value.
+        """
+        d_column    = self.d_column[tag]
+        if d_column['kind'] == 'num':
+            return np.nonzero(fn_test(self.column(tag)))[0]
+        l_code      = [c for c, v in enumerate(d_column['l_value'])
+                       if v is not None and fn_test(v)]
+        return np.nonzero(np.isin(np.frombuffer(d_column['data'],
+                                                dtype = np.uint32), l_code))[0]
+
+    def group_by(self, tag, indices = None):
+        """
+        A dictionary of the row indices (optionally within <indices>)
+        per distinct value of <tag>.
+        """
+        d_column    = self.d_column[tag]
+        if d_column['kind'] == 'num':
+            v_key   = self.column(tag)
+            l_value = None
+        else:
+            v_key   = np.frombuffer(d_column['data'], dtype = np.uint32)
+            l_value = d_column['l_value']
+        if indices is not None:
+            v_row   = np.asarray(indices)
+            v_key   = v_key[v_row]
+        else:
+            v_row   = np.arange(self.rows)
+        d_group     = {}
+        v_unique, v_inverse = np.unique(v_key, return_inverse = True)
+        for i, key in enumerate(v_unique):
+            key     = l_value[key] if l_value is not None else float(key)
+            d_group[key]    = v_row[v_inverse == i]
+        return d_group
+
+    def row(self, index):
+        d_row       = {}
+        for tag, d_column in self.d_column.items():
+            value   = d_column['data'][index]
+            if d_column['kind'] == 'num':
+                d_row[tag]  = None if value != value else \
+                              int(value) if d_column['b_int'] else value
+            else:
+                d_row[tag]  = d_column['l_value'][value]
+        return d_row
+
+    def save(self, str_fileName, str_format = 'csv'):
+        """
+        Export the columns to <str_fileName> as 'csv', 'json' (a list
+        of row objects) or 'npz' (numeric columns as float arrays,
+        string columns as <tag>.codes and <tag>.values arrays).
+        """
+        if str_format == 'npz':
+            d_array = {}
+            for tag, d_column in self.d_column.items():
+                if d_column['kind'] == 'num':
+                    d_array[tag]    = self.column(tag)
+                else:
+                    d_array[tag + '.codes']     = np.frombuffer(d_column['data'],
+                                                                dtype = np.uint32)
+                    d_array[tag + '.values']    = np.array(
+                                                    [v or '' for v in d_column['l_value']])
+            np.savez_compressed(str_fileName, **d_array)
+        elif str_format == 'json':
+            with open(str_fileName, 'w') as f:
+                json.dump([self.row(i) for i in range(self.rows)], f, indent = 4)
+        else:
+            with open(str_fileName, 'w', newline = '') as f:
+                w = csv.DictWriter(f, list(self.d_column.keys()))
+                w.writeheader()
+                for i in range(self.rows):
+                    w.writerow(self.row(i))
+        return {
+            'status':   True,
+            'file':     str_fileName
+        }
+
+class aggregate_count(object):
+    """
+    An exact count of each distinct value of a tag. Memory grows with
+    the number of distinct values, so this is meant for low
+    cardinality tags such as Modality or Manufacturer.
+    """
+
+    def __init__(self, str_tag, *args):
+        self.str_kind   = 'count'
+        self.str_tag    = str_tag
+        self.d_count    = {}
+
+    def update(self, value):
+        str_value               = 'None' if value is None else str(value)
+        self.d_count[str_value] = self.d_count.get(str_value, 0) + 1
+
+    def summary(self):
+        return {
+            'kind':     self.str_kind,
+            'tag':      self.str_tag,
+            'counts':   dict(sorted(self.d_count.items(),
+                                    key = lambda kv: -kv[1]))
+        }
+
+class aggregate_histogram(object):
+    """
+    A fixed-bin histogram of the numeric value of a tag over the range
+    [lo, hi), with separate under/overflow and missing counts. Age
+    strings (e.g. PatientAge '034Y') are converted to years.
+    """
+
+    def __init__(self, str_tag, lo = 0, hi = 100, bins = 10, *args):
+        self.str_kind   = 'hist'
+        self.str_tag    = str_tag
+        self.f_lo       = float(lo)
+        self.f_hi       = float(hi)
+        self.bins       = int(bins)
+        if self.bins < 1 or not self.f_lo < self.f_hi:
+            raise ValueError('need bins >= 1 and lo < hi')
+        self.l_count    = [0] * self.bins
+        self.underflow  = 0
+        self.overflow   = 0
+        self.missing    = 0
+
+    @staticmethod
+    def number(value):
+        """
+        Return <value> as a float (or None), converting DICOM age
+        strings to years.
+        """
+        str_value   = str(value).strip()
+        d_ageUnit   = {'Y': 1.0, 'M': 12.0, 'W': 52.1775, 'D': 365.25}
+        try:
+            if len(str_value) and str_value[-1] in d_ageUnit:
+                return float(str_value[:-1]) / d_ageUnit[str_value[-1]]
+            return float(str_value)
+        except ValueError:
+            return None
+
+    def update(self, value):
+        f_value = None if value is None else self.number(value)
+        if f_value is None:
+            self.missing    += 1
+        elif f_value < self.f_lo:
+            self.underflow  += 1
+        elif f_value >= self.f_hi:
+            self.overflow   += 1
+        else:
+            index   = int((f_value - self.f_lo) / (self.f_hi - self.f_lo) * self.bins)
+            self.l_count[min(index, self.bins - 1)] += 1
+
+    def summary(self):
+        f_width = (self.f_hi - self.f_lo) / self.bins
+        return {
+            'kind':         self.str_kind,
+            'tag':          self.str_tag,
+            'edges':        [self.f_lo + i * f_width for i in range(self.bins + 1)],
+            'counts':       self.l_count,
+            'underflow':    self.underflow,
+            'overflow':     self.overflow,
+            'missing':      self.missing
+        }
+
+class aggregate_topK(object):
+    """
+    The (approximate) <k> most frequent values of a tag, in bounded
+    memory, using the Space-Saving algorithm. Each reported count
+    over-estimates the true count by at most the reported 'error'.
+    """
+
+    def __init__(self, str_tag, k = 20, *args):
+        self.str_kind   = 'topk'
+        self.str_tag    = str_tag
+        self.k          = int(k)
+        self.d_count    = {}
+        self.d_error    = {}
+
+    def update(self, value):
+        str_value   = 'None' if value is None else str(value)
+        if str_value in self.d_count:
+            self.d_count[str_value] += 1
+        elif len(self.d_count) < self.k:
+            self.d_count[str_value]  = 1
+            self.d_error[str_value]  = 0
+        else:
+            str_min = min(self.d_count, key = self.d_count.get)
+            count   = self.d_count.pop(str_min)
+            self.d_error.pop(str_min)
+            self.d_count[str_value]  = count + 1
+            self.d_error[str_value]  = count
+
+    def summary(self):
+        l_top   = sorted(self.d_count.items(), key = lambda kv: -kv[1])
+        return {
+            'kind':     self.str_kind,
+            'tag':      self.str_tag,
+            'top':      [{'value': v, 'count': c, 'error': self.d_error[v]}
+                         for v, c in l_top]
+        }
+
+class aggregate_distinct(object):
+    """
+    An approximate count of the distinct values of a tag in constant
+    memory, using a HyperLogLog sketch with 2**<precision> registers
+    (a standard error of about 1.04/sqrt(2**precision)).
+    """
+
+    def __init__(self, str_tag, precision = 12, *args):
+        self.str_kind   = 'distinct'
+        self.str_tag    = str_tag
+        self.precision  = int(precision)
+        self.m          = 1 << self.precision
+        self.l_register = bytearray(self.m)
+
+    def update(self, value):
+        if value is None:
+            return
+        h       = int.from_bytes(
+                    hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+        index   = h >> (64 - self.precision)
+        w       = h & ((1 << (64 - self.precision)) - 1)
+        rank    = (64 - self.precision) - w.bit_length() + 1
+        if rank > self.l_register[index]:
+            self.l_register[index] = rank
+
+    def estimate(self):
+        f_alpha = 0.7213 / (1 + 1.079 / self.m)
+        f_sum   = sum(2.0 ** -r for r in self.l_register)
+        f_est   = f_alpha * self.m * self.m / f_sum
+        zeros   = self.l_register.count(0)
+        if f_est <= 2.5 * self.m and zeros:
+            f_est = self.m * np.log(self.m / zeros)
+        return int(round(f_est))
+
+    def summary(self):
+        return {
+            'kind':     self.str_kind,
+            'tag':      self.str_tag,
+            'distinct': self.estimate()
+        }
+
+class pfdicom_tag(pfdicom):
+    """
+    A class based on the 'pfdicom' infrastructure that extracts 
+    and processes DICOM tags according to several requirements.
+    """
+
+    def declare_selfvars(self):
+        """
+        A block to declare self variables
+        """
+        self._dictErr = {
+            'imageFileSpecFail'   : {
+                'action'        : 'trying to parse image file specified, ',
+                'error'         : 'wrong format found. Must be [<index>:]<filename>',
+                'exitCode'      : 1},
+            'inputTAGLISTFileFail': {
+                'action'        : 'trying to read input <tagFileList>, ',
+                'error'         : 'could not access/read file -- does it exist? Do you have permission?',
+                'exitCode'      : 20
+                },
+            'inputArchiveFail'  : {
+                'action'        : 'trying to open the input archive, ',
+                'error'         : 'input is a file, but not a zip or tar archive',
+                'exitCode'      : 2
+                },
+            'whereSpecFail'     : {
+                'action'        : 'trying to parse the where clause, ',
+                'error'         : 'invalid syntax. See the --where help for the predicate language',
+                'exitCode'      : 40
+                },
+            'aggregateSpecFail' : {
+                'action'        : 'trying to parse the aggregate specified, ',
+                'error'         : 'wrong format found. Must be <kind>:<tag>[:<arg>...] with <kind> one of count, hist, topk, distinct',
+                'exitCode'      : 50
+                },
+            'tagPathFail'       : {
+                'action'        : 'trying to parse the tag list, ',
+                'error'         : 'invalid tag path. See the -T help for the path syntax',
+                'exitCode'      : 60
+                },
+            'orderSpecFail'     : {
+                'action'        : 'trying to parse the processing order, ',
+                'error'         : 'must be one of walk, inode, extent or size',
+                'exitCode'      : 70
+                },
+            'compressSpecFail'  : {
+                'action'        : 'trying to parse the compression specified, ',
+                'error'         : 'must be <algorithm>[:<level>] with <algorithm> one of gzip, bz2, xz, zstd (zstd needs the zstandard module)',
+                'exitCode'      : 80
+                },
+            'bundleSpecFail'    : {
+                'action'        : 'trying to parse the bundle specified, ',
+                'error'         : 'must be one of zip or tar',
+                'exitCode'      : 90
+                },
+            'columnsSpecFail'   : {
+                'action'        : 'trying to parse the columns format, ',
+                'error'         : 'must be one of csv, json or npz',
+                'exitCode'      : 100
+                },
+            'fileListFail'      : {
+                'action'        : 'trying to read the input <fileList>, ',
+                'error'         : 'could not access/read file -- does it exist? Do you have permission?',
+                'exitCode'      : 120
+                },
+            'throttleSpecFail'  : {
+                'action'        : 'trying to parse the throttle rates, ',
+                'error'         : 'must be a number, optionally with a K, M or G suffix',
+                'exitCode'      : 110
+                },
+            'shardSpecFail'     : {
+                'action'        : 'trying to parse the shard specified, ',
+                'error'         : 'wrong format found. Must be <index>/<count> with 0 <= <index> < <count>',
+                'exitCode'      : 30
+                }
+            }
+
+        #
+        # Object desc block
+        #
+        self.str_desc                  = ''
+        self.__name__                  = "pfdicom_tag"
+
+        # Directory and filenames
+        # self.str_workingDir            = ''
+        self.str_inputDir              = ''
+        self.str_inputFile             = ''
+        self.str_extension             = ''
+        # self.str_fileIndex             = ''
+        # self.l_inputDirTree            = []
+        self.str_outputFileStem        = ''
+        self.str_outputFileType        = ''
+        self.l_outputFileType          = []
+        self.str_outputDir             = ''
+        # self.d_outputTree              = {}
+
+        # Archive input
+        self.archive                   = None
+        self.d_archiveMember           = {}
+
+        # Memory mapped reads
+        self.b_mmap                    = False
+        self.mmap                      = None
+        self.mmapDeferSize             = 16384
+
+        # A list of the input files (or '-' for stdin), read instead of
+        # walking the input directory
+        self.str_fileList              = ''
+
+        # I/O rate limits of the reads and report writes, if any
+        self.throttle                  = None
+        self.throttleFiles             = 0.0
+        self.throttleBytes             = 0.0
+        self.b_throttleAdaptive        = False
+
+        self.str_stdout                = ''
+        self.str_stderr                = ''
+        self.exitCode                  = 0
+
+        # The actual data volume and slice
+        # are numpy ndarrays
+        # self.dcm                       = None
+        # self.str_outputFormat          = ''
+        # self.l_tagRaw                  = []     # tag list
+        # self.d_dcm                     = {}     # dict convert of raw dcm
+        # Following are filtered by tagList
+        self.d_dicom                   = {}     # values directly from dcm ojbect
+        self.d_dicomSimple             = {}     # formatted dict convert
+
+        # String representations of different outputFormats
+        self.strRaw                    = ''
+        self.str_json                  = ''
+        self.str_dict                  = ''
+        self.str_col                   = ''
+        self.str_raw                   = ''
+        self.str_dcmjson               = ''
+
+        # Image conversion
+        self.b_convertToImg            = False
+        self.str_outputImageFile       = ''
+        self.str_imageIndex            = ''
+
+        # Slice ordering for image selection, cached per directory
+        self.d_sliceOrder              = {}
+        self.sliceWorkers              = 8
+
+        # Tags
+        self.b_tagList                 = False
+        self.b_tagFile                 = False
         self.str_tagList               = ''
         self.str_tagFile               = ''
         self.l_tag                     = []
+        self.d_tagPath                 = {}     # compiled non-keyword tags
 
         # Flags
         self.b_printToScreen           = False
+        self.b_sniff                   = False
+
+        # Header query filter, compiled once from <str_where>
+        self.str_where                 = ''
+        self.query                     = None
+
+        # Cohort aggregation -- streaming aggregators instead of
+        # per-series reports
+        self.str_aggregate             = ''
+        self.l_aggregate               = []
+        self.aggregateSeries           = 0
+
+        # SQLite tag index output, inserted in batched transactions
+        self.sqlite                    = None
+        self.sqliteBatch               = 1000
+        self.sqlitePending             = 0
+
+        # Processing order of the series: 'walk', 'inode', 'extent'
+        # or 'size'
+        self.str_order                 = 'walk'
+        self.planSample                = 5
+
+        # Read-ahead of the upcoming series files
+        self.prefetchAhead             = 0
+        self.prefetchBytes             = 65536
+
+        # Fault isolation: per-file timeout, retries of transient read
+        # errors, and the series quarantined on failure
+        self.timeout                   = 0.0
+        self.retries                   = 2
+        self.retryBackoff              = 0.5
+        self.l_quarantine              = []
+        self.str_quarantineFile        = ''
+
+        # Compression of the per-series reports
+        self.str_compress              = ''
+        self.compressLevel             = None
+
+        # Bundling of all the reports of a run into one container,
+        # with members laid out as the output tree
+        self.str_bundle                = ''
+        self.bundle                    = None
+        self.str_bundleFile            = ''
+        self.str_bundleDir             = ''
+        self.bundleIndex               = None
+
+        # Per-series pixel statistics, over all the files of a series
+        self.b_pixelStats              = False
+        self.pixelBins                 = 32
+        self.pixelChunk                = 1 << 20
+        self.d_seriesFiles             = {}
+
+        # Columnar store of the tags of all series of a run, and the
+        # format it is saved in at the end
+        self.str_columns               = ''
+        self.columns                   = None
+
+        # Progress reporting, shared with the pftree of a run
+        self.progress                  = None
+
+        # Watch mode
+        self.watchQuiet                = 30.0
+        self.watchPoll                 = 10.0
+
+        # Sharding
+        self.str_shard                 = ''
+        self.shardIndex                = 0
+        self.shardCount                = 1
 
         self.dp                        = None
         self.log                       = None
@@ -604,15 +2426,23 @@ class pfdicom_tag(pfdicom):
                 self.str_imageIndex         = l_indexAndFile[0]
             if not b_OK:
                 self.dp.qprint("Invalid image specifier.", comms = 'error')
-                self.fatal(self, 'imageFileSpecFail')
+                self.fatal('imageFileSpecFail')
             if len(self.str_outputImageFile):
                 self.b_convertToImg         = True
 
+        def tagPaths_compile():
+            try:
+                self.d_tagPath.update({t: pftagpath(t) for t in self.l_tag
+                                       if pftagpath.is_path(t)})
+            except ValueError as e:
+                self.fatal('tagPathFail', '\n%s' % e)
+
         def tagList_process(str_tagList):
             self.str_tagList            = str_tagList
             if len(self.str_tagList):
                 self.b_tagList          = True
                 self.l_tag              = self.str_tagList.split(',')
+                tagPaths_compile()
 
         def tagFile_process(str_tagFile):
             self.str_tagFile            = str_tagFile
@@ -620,11 +2450,110 @@ class pfdicom_tag(pfdicom):
                 self.b_tagFile          = True
                 with open(self.str_tagFile) as f:
                     self.l_tag          =  [x.strip('\n') for x in f.readlines()]
+                tagPaths_compile()
 
         def outputFile_process(str_outputFile):
             self.str_outputFileType     = str_outputFile
             self.l_outputFileType       = self.str_outputFileType.split(',')
 
+        def where_process(str_where):
+            self.str_where              = str_where
+            if not len(self.str_where):
+                return
+            try:
+                self.query              = pfquery(self.str_where)
+            except ValueError as e:
+                self.dp.qprint("Invalid where clause: %s" % e, comms = 'error')
+                self.fatal('whereSpecFail')
+
+        def aggregate_process(str_aggregate):
+            d_kind                      = {
+                'count':    aggregate_count,
+                'hist':     aggregate_histogram,
+                'topk':     aggregate_topK,
+                'distinct': aggregate_distinct
+            }
+            self.str_aggregate          = str_aggregate
+            if not len(self.str_aggregate):
+                return
+            try:
+                for str_spec in self.str_aggregate.split(','):
+                    l_spec              = str_spec.strip().split(':')
+                    self.l_aggregate.append(d_kind[l_spec[0]](*l_spec[1:]))
+                    str_tag             = self.l_aggregate[-1].str_tag
+                    if pftagpath.is_path(str_tag):
+                        self.d_tagPath[str_tag] = pftagpath(str_tag)
+            except (KeyError, TypeError, ValueError, ZeroDivisionError):
+                self.dp.qprint("Invalid aggregate specifier: %s" % str_spec,
+                                comms = 'error')
+                self.fatal('aggregateSpecFail')
+
+        def columns_process(str_columns):
+            self.str_columns            = str_columns
+            if not len(self.str_columns):
+                return
+            if self.str_columns not in ('csv', 'json', 'npz'):
+                self.fatal('columnsSpecFail')
+            self.columns                = pfcolumns()
+
+        def rate_process(str_rate):
+            # A rate, optionally with a (binary) K, M or G multiplier
+            str_rate                    = str(str_rate).strip().upper()
+            multiplier                  = 1
+            if str_rate[-1:] in ('K', 'M', 'G'):
+                multiplier              = 1024 ** ('KMG'.index(str_rate[-1]) + 1)
+                str_rate                = str_rate[:-1]
+            try:
+                f_rate                  = float(str_rate or 0) * multiplier
+            except ValueError:
+                self.fatal('throttleSpecFail')
+            if f_rate < 0:
+                self.fatal('throttleSpecFail')
+            return f_rate
+
+        def bundle_process(str_bundle):
+            self.str_bundle             = str_bundle
+            if len(self.str_bundle) and self.str_bundle not in ('zip', 'tar'):
+                self.fatal('bundleSpecFail')
+
+        def compress_process(str_compress):
+            l_spec                      = str_compress.split(':')
+            self.str_compress           = l_spec[0]
+            if not len(self.str_compress):
+                return
+            try:
+                if len(l_spec) > 1:
+                    self.compressLevel  = int(l_spec[1])
+            except ValueError:
+                self.fatal('compressSpecFail')
+            if self.str_compress not in self._d_compressSuffix or \
+               (self.str_compress == 'zstd' and zstandard is None):
+                self.fatal('compressSpecFail')
+
+        def order_process(str_order):
+            self.str_order              = str_order if len(str_order) else 'walk'
+            if self.str_order not in ('walk', 'inode', 'extent', 'size'):
+                self.fatal('orderSpecFail')
+
+        def shard_process(str_shard):
+            if not len(str_shard):
+                str_shard               = self.shardSpec_fromEnv()
+            self.str_shard              = str_shard
+            if not len(self.str_shard):
+                return
+            try:
+                l_indexAndCount         = self.str_shard.split('/')
+                self.shardIndex         = int(l_indexAndCount[0])
+                self.shardCount         = int(l_indexAndCount[1])
+                b_OK                    = len(l_indexAndCount) == 2 and \
+                                          0 <= self.shardIndex < self.shardCount
+            except:
+                b_OK                    = False
+            if not b_OK:
+                self.dp.qprint("Invalid shard specifier: %s" % self.str_shard,
+                                comms = 'error')
+                self.fatal('shardSpecFail')
+
         # pudb.set_trace()
         self.declare_selfvars()
 
@@ -639,16 +2568,52 @@ class pfdicom_tag(pfdicom):
             if key == "outputFileType":     outputFile_process(value) 
             if key == 'printToScreen':      self.b_printToScreen       = value
             if key == 'imageFile':          imageFileName_process(value)
+            if key == 'sliceWorkers':       self.sliceWorkers          = int(value)
             if key == 'tagFile':            tagFile_process(value)
             if key == 'tagList':            tagList_process(value)
+            if key == 'where':              where_process(value)
+            if key == 'aggregate':          aggregate_process(value)
+            if key == 'shard':              shard_process(value)
+            if key == 'order':              order_process(value)
+            if key == 'planSample':         self.planSample            = int(value)
+            if key == 'compress':           compress_process(value)
+            if key == 'columns':            columns_process(value)
+            if key == 'pixelStats':         self.b_pixelStats          = bool(value)
+            if key == 'pixelBins':          self.pixelBins             = int(value)
+            if key == 'bundle':             bundle_process(value)
+            if key == 'timeout':            self.timeout               = float(value)
+            if key == 'retries':            self.retries               = int(value)
+            if key == 'fileList':           self.str_fileList          = value \
+                                                if value in ('', '-') else os.path.abspath(value)
+            if key == 'throttleFiles':      self.throttleFiles         = rate_process(value)
+            if key == 'throttleBytes':      self.throttleBytes         = rate_process(value)
+            if key == 'throttleAdaptive':   self.b_throttleAdaptive    = bool(value)
+            if key == 'prefetch':           self.prefetchAhead         = int(value)
+            if key == 'prefetchBytes':      self.prefetchBytes         = int(value)
+            if key == 'watchQuiet':         self.watchQuiet            = float(value)
+            if key == 'watchPoll':          self.watchPoll             = float(value)
             if key == 'verbosity':          self.verbosityLevel         = int(value)
 
+        # Sharding can also be driven purely from a job-array environment
+        if 'shard' not in kwargs:           shard_process('')
+
+        if self.throttleFiles or self.throttleBytes or self.b_throttleAdaptive:
+            self.throttle               = pfthrottle(
+                                            files       = self.throttleFiles,
+                                            bytes       = self.throttleBytes,
+                                            adaptive    = self.b_throttleAdaptive
+                                          )
+
         # Set logging
         self.dp                        = pfmisc.debug(    
                                             verbosity   = self.verbosityLevel,
                                             level       = 0,
                                             within      = self.__name__
                                             )
+        self.dlog                      = pflog(
+                                            debug       = self.dp,
+                                            verbosity   = self.verbosityLevel
+                                            )
         self.log                       = pfmisc.Message()
         self.log.syslog(True)
 
@@ -658,26 +2623,165 @@ class pfdicom_tag(pfdicom):
         #     self.dp.qprint("input directory not specified.", comms = 'error')
         #     self.fatal('inputDirFail')
 
+    def shardSpec_fromEnv(self):
+        """
+        Return a shard specifier "<index>/<count>" derived from
+        common job-array environment variables, or an empty string
+        if none are set. An explicit PFDICOMTAG_SHARD takes
+        precedence over SLURM and SGE array variables.
+        """
+        str_shard   = os.environ.get('PFDICOMTAG_SHARD', '')
+        if len(str_shard):
+            return str_shard
+        if 'SLURM_ARRAY_TASK_ID' in os.environ and \
+           'SLURM_ARRAY_TASK_COUNT' in os.environ:
+            # Stepped arrays (--array=0-10:2) number their tasks
+            # <min>, <min> + <step>, ...
+            step    = int(os.environ.get('SLURM_ARRAY_TASK_STEP', '1') or 1)
+            index   = (int(os.environ['SLURM_ARRAY_TASK_ID']) - \
+                       int(os.environ.get('SLURM_ARRAY_TASK_MIN', '0'))) // step
+            return '%d/%s' % (index, os.environ['SLURM_ARRAY_TASK_COUNT'])
+        if os.environ.get('SGE_TASK_ID', 'undefined') != 'undefined' and \
+           'SGE_TASK_LAST' in os.environ:
+            first   = int(os.environ.get('SGE_TASK_FIRST', '1'))
+            step    = int(os.environ.get('SGE_TASK_STEPSIZE', '1'))
+            last    = int(os.environ['SGE_TASK_LAST'])
+            index   = (int(os.environ['SGE_TASK_ID']) - first) // step
+            return '%d/%d' % (index, (last - first) // step + 1)
+        return ''
+
+    def outputName_shard(self, str_name):
+        """
+        If running sharded, insert a shard suffix into <str_name>
+        (before any extension), so that the run-level outputs of
+        different nodes do not collide.
+        """
+        if self.shardCount <= 1:
+            return str_name
+        str_stem, str_ext   = os.path.splitext(str_name)
+        return '%s-shard%dof%d%s' % (str_stem, self.shardIndex,
+                                     self.shardCount, str_ext)
+
+    def shardIndex_save(self, d_inputTree):
+        """
+        Write an index of the series processed by this shard into the
+        <outputDir>.
+        """
+        self.mkdir(self.str_outputDir)
+        str_fileName    = os.path.join(self.str_outputDir,
+                                       self.outputName_shard('index.txt'))
+        with open(str_fileName, 'w') as f:
+            for path, l_file in d_inputTree.items():
+                f.write('%s\t%s\n' % (path, os.path.basename(l_file[0])))
+        self.dp.qprint('Saved shard index: %s' % str_fileName)
+        return {
+            'status':   True,
+            'file':     str_fileName
+        }
+
+    def file_admit(self, str_file):
+        """
+        Callback for the tree walk to decide whether <str_file> enters
+        the input tree: the (cheap) extension check first, and then
+        the DICM sniff on the file contents.
+        """
+        if len(self.str_extension) and self.str_extension not in str_file:
+            return False
+        return self.DICOMfile_sniff(str_file)
+
+    def where_match(self, al_file, *args, **kwargs):
+        """
+        Callback to filter series on the where clause: only the tags
+        referenced by the clause are read from the header of the
+        series file, and the compiled predicate is evaluated on them.
+        """
+        with self.file_open(al_file[0]) as fp:
+            ds  = dicom.read_file(  fp,
+                                    stop_before_pixels  = True,
+                                    specific_tags       = self.query.l_tag,
+                                    force               = self.b_sniff)
+        return self.query.match(ds)
+
+    def slicePosition_read(self, str_file):
+        """
+        Read just the InstanceNumber and patient position/orientation
+        of <str_file>, and return its sort key within the series:
+        the InstanceNumber if present, else the position along the
+        slice normal, else None.
+        """
+        try:
+            with self.file_open(str_file) as fp:
+                ds  = dicom.read_file(  fp,
+                                        stop_before_pixels  = True,
+                                        specific_tags       = [
+                                            'InstanceNumber',
+                                            'ImagePositionPatient',
+                                            'ImageOrientationPatient'],
+                                        force               = self.b_sniff)
+        except Exception:
+            return None
+        try:
+            return float(ds.InstanceNumber)
+        except (AttributeError, TypeError, ValueError):
+            pass
+        try:
+            v_orient    = np.array(ds.ImageOrientationPatient, dtype = float)
+            v_normal    = np.cross(v_orient[:3], v_orient[3:])
+            return float(np.dot(v_normal,
+                                np.array(ds.ImagePositionPatient, dtype = float)))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def filelist_sort(self, al_file):
+        """
+        Return <al_file> in slice order. The headers are read in
+        parallel, and the order is cached per directory (for as long
+        as its file list does not change). Files without a usable
+        position keep their name order, after the ordered ones.
+        """
+        str_dir     = os.path.dirname(al_file[0])
+        t_files     = tuple(al_file)
+        if str_dir in self.d_sliceOrder and \
+           self.d_sliceOrder[str_dir][0] == t_files:
+            return self.d_sliceOrder[str_dir][1]
+        if self.str_order in ('inode', 'extent'):
+            al_file = sorted(al_file, key = self.file_location)
+        with concurrent.futures.ThreadPoolExecutor(
+                        max_workers = max(1, self.sliceWorkers)) as pool:
+            l_key   = list(pool.map(self.slicePosition_read, al_file))
+        l_sorted    = [f for k, f in sorted(
+                        zip(l_key, al_file),
+                        key = lambda t: (t[0] is None, t[0] or 0, t[1]))]
+        self.d_sliceOrder[str_dir] = (t_files, l_sorted)
+        return l_sorted
+
     def filelist_prune(self, al_file, *args, **kwargs):
         """
         Given a list of files, select a single file for further
-        analysis.
+        analysis. When converting to an image, the files are put in
+        slice order first, so that the first, middle, last or
+        <index>ed file is the corresponding slice of the series.
         """
         if len(self.str_extension):
             al_file = [x for x in al_file if self.str_extension in x]
+        if not len(al_file):
+            return {
+                'status':   False,
+                'l_file':   []
+            }
         if self.b_convertToImg:
-            if self.str_imageIndex == 'm':
-                if len(al_file):
-                    seriesFile = al_file[int(len(al_file)/2)]
-                b_imageIndexed  = True
-            if self.str_imageIndex == 'f':
-                seriesFile = al_file[:-1]
-                b_imageIndexed  = True
-            if self.str_imageIndex == 'l':
+            al_file = self.filelist_sort(al_file)
+            if self.str_imageIndex in ('', 'm'):
+                seriesFile = al_file[int(len(al_file)/2)]
+            elif self.str_imageIndex == 'f':
                 seriesFile = al_file[0]
-                b_imageIndexed  = True
-            if not b_imageIndexed:
-                seriesFile = al_file[int(self.str_imageIndex)]
+            elif self.str_imageIndex == 'l':
+                seriesFile = al_file[-1]
+            else:
+                try:
+                    seriesFile = al_file[int(self.str_imageIndex)]
+                except (IndexError, ValueError):
+                    seriesFile = al_file[int(len(al_file)/2)]
         else:
             seriesFile  = al_file[0]
         return {
@@ -685,6 +2789,169 @@ class pfdicom_tag(pfdicom):
             'l_file':   [seriesFile]
         }
 
+    def pixelData_needed(self):
+        """
+        PixelData is only consumed when converting to an image.
+        """
+        return self.b_convertToImg
+
+    def datasetCopy_needed(self):
+        """
+        The reports are built from the requested tags alone, so the
+        dataset is never decoded as a whole.
+        """
+        return False
+
+    def tag_value(self, dcm, str_tag):
+        """
+        The value of the keyword or tag path <str_tag> in <dcm>, or
+        None if absent.
+        """
+        if pftagpath.is_path(str_tag):
+            if str_tag not in self.d_tagPath:
+                self.d_tagPath[str_tag] = pftagpath(str_tag)
+            return self.d_tagPath[str_tag].value(dcm)
+        return getattr(dcm, str_tag, None)
+
+    # The percentiles reported by pixelStats_find()
+    _l_percentile   = [1, 5, 50, 95, 99]
+
+    def pixelStats_find(self, al_file):
+        """
+        Pixel QA statistics over all the frames of the files in
+        <al_file> (a series), in modality units (i.e. after the
+        rescale slope and intercept): min, max, mean, std, the
+        percentiles, a <pixelBins> histogram over [min, max], and the
+        fractions of zero and of saturated (stored maximum) voxels.
+
+        Only one file is held in memory at a time, and it is reduced
+        in chunks of <pixelChunk> voxels. For stored values of up to
+        16 bits, the reductions work on the integer values with an
+        exact bincount, so the percentiles and histogram are exact and
+        no float copy of the data is made; wider (or float) pixel
+        data only get min, max, mean, std and the zero fraction.
+        Files whose pixels cannot be decoded are skipped and counted.
+        """
+        voxels      = 0
+        f_sum       = 0.0
+        f_sumSq     = 0.0
+        zeros       = 0
+        saturated   = 0
+        v_min       = None
+        v_max       = None
+        v_count     = None          # counts per stored value
+        storedMin   = 0
+        storedMax   = 0
+        slope       = 1.0
+        intercept   = 0.0
+        files       = 0
+        skipped     = 0
+        for str_file in al_file:
+            if self.throttle is not None:
+                self.throttle.acquire(files = 1, bytes = self.file_size(str_file))
+            try:
+                with self.file_open(str_file) as fp:
+                    ds  = dicom.read_file(fp, force = self.b_sniff)
+                arr     = ds.pixel_array
+            except Exception:
+                skipped    += 1
+                continue
+            files      += 1
+            slope       = float(getattr(ds, 'RescaleSlope', 1) or 1)
+            intercept   = float(getattr(ds, 'RescaleIntercept', 0) or 0)
+            bitsStored  = int(getattr(ds, 'BitsStored', 0) or 0)
+            b_exact     = arr.dtype.kind in 'iu' and 0 < bitsStored <= 16
+            if b_exact:
+                if int(getattr(ds, 'PixelRepresentation', 0)):
+                    storedMin, storedMax = -(1 << (bitsStored - 1)), \
+                                           (1 << (bitsStored - 1)) - 1
+                else:
+                    storedMin, storedMax = 0, (1 << bitsStored) - 1
+                if v_count is None:
+                    v_count = np.zeros(storedMax - storedMin + 1, dtype = np.int64)
+            flat        = arr.reshape(-1)
+            for start in range(0, flat.size, self.pixelChunk):
+                chunk       = flat[start : start + self.pixelChunk]
+                voxels     += chunk.size
+                if b_exact and v_count is not None and \
+                   len(v_count) == storedMax - storedMin + 1:
+                    v_count    += np.bincount(
+                                    np.clip(chunk, storedMin, storedMax).astype(np.int64)
+                                    - storedMin,
+                                    minlength = len(v_count))
+                    continue
+                f_chunk     = chunk.astype(np.float64) * slope + intercept
+                f_sum      += f_chunk.sum()
+                f_sumSq    += np.square(f_chunk).sum()
+                zeros      += int(np.count_nonzero(f_chunk == 0))
+                v_min       = f_chunk.min() if v_min is None else min(v_min, f_chunk.min())
+                v_max       = f_chunk.max() if v_max is None else max(v_max, f_chunk.max())
+        d_stats     = {
+            'pixelFiles':               files,
+            'pixelFilesSkipped':        skipped,
+            'pixelVoxels':              voxels
+        }
+        if not voxels:
+            return d_stats
+        l_histogram = None
+        d_percentile    = {}
+        if v_count is not None and v_count.sum():
+            # Fold the exact counts into the running (float) moments,
+            # then derive the order statistics from them.
+            v_value     = np.arange(storedMin, storedMax + 1) * slope + intercept
+            f_sum      += float(np.dot(v_count, v_value))
+            f_sumSq    += float(np.dot(v_count, np.square(v_value)))
+            zeros      += int(v_count[v_value == 0].sum())
+            saturated   = int(v_count[-1])
+            nz          = np.nonzero(v_count)[0]
+            l_minmax    = [v_value[nz[0]], v_value[nz[-1]]]
+            v_min       = min(l_minmax) if v_min is None else min(v_min, min(l_minmax))
+            v_max       = max(l_minmax) if v_max is None else max(v_max, max(l_minmax))
+            order       = np.argsort(v_value) if slope < 0 else slice(None)
+            v_cum       = np.cumsum(v_count[order])
+            for p in self._l_percentile:
+                d_percentile['pixelP%02d' % p] = float(v_value[order][
+                    np.searchsorted(v_cum, p / 100.0 * v_cum[-1])])
+            if v_max > v_min:
+                l_histogram = np.histogram(v_value, bins = self.pixelBins,
+                                           range = (v_min, v_max),
+                                           weights = v_count)[0].astype(np.int64).tolist()
+            else:
+                l_histogram = [int(v_count.sum())] + [0] * (self.pixelBins - 1)
+        f_mean      = f_sum / voxels
+        d_stats.update({
+            'pixelMin':                 float(v_min),
+            'pixelMax':                 float(v_max),
+            'pixelMean':                f_mean,
+            'pixelStd':                 float(np.sqrt(max(f_sumSq / voxels - f_mean ** 2, 0.0))),
+            'pixelZeroFraction':        zeros / voxels,
+            'pixelSaturatedFraction':   saturated / voxels
+        })
+        d_stats.update(d_percentile)
+        if l_histogram is not None:
+            d_stats['pixelHistogram']       = l_histogram
+            d_stats['pixelHistogramRange']  = [float(v_min), float(v_max)]
+        return d_stats
+
+    @staticmethod
+    def dicomJSON_encode(l_element):
+        """
+        Encode the data elements in <l_element> as a compact DICOM JSON
+        (PS3.18 F.2) object, i.e. keyed by the 8 hex digit tag, with
+        the VR and typed 'Value' arrays (numbers as numbers, one entry
+        per value of a multi-valued element, person names as objects,
+        sequences as nested objects, binary data inline as base64).
+        orjson is used as the encoder when available.
+        """
+        d_json  = {}
+        for element in l_element:
+            if not isinstance(element, dicom.dataelem.DataElement):
+                continue
+            d_json['%08X' % element.tag]    = element.to_json_dict(None, 1024)
+        if orjson is not None:
+            return orjson.dumps(d_json, option = orjson.OPT_SORT_KEYS).decode()
+        return json.dumps(d_json, sort_keys = True, separators = (',', ':'))
+
     def tagsFindOnFile(self, *args, **kwargs):
         """
         Return the tag information for given file.
@@ -715,10 +2982,13 @@ class pfdicom_tag(pfdicom):
         self.str_dict       = ''
         self.str_col        = ''
         self.str_raw        = '' 
+        self.str_dcmjson    = ''
         if len(str_file):
-            self.dp.qprint("Analysing  in path: %s" % str_path)
-            self.dp.qprint("Analysing tags for: %s" % str_localFile)      
+            self.dlog("Analysing  in path: %s", str_path)
+            self.dlog("Analysing tags for: %s", str_localFile)      
             self.DICOMfile_read( file = str_file)      
+            if self.progress is not None and self.progress.b_enabled:
+                self.progress.count(bytes = self.file_size(str_file))
             # self.dcm       = dicom.read_file(str_file)
             # self.d_dcm     = dict(self.dcm)
             # self.strRaw    = str(self.dcm)
@@ -733,13 +3003,34 @@ class pfdicom_tag(pfdicom):
             if 'PixelData' in l_tagsToUse:
                 l_tagsToUse.remove('PixelData')
             for key in l_tagsToUse:
-                self.d_dicom[key]       = self.dcm.data_element(key)
+                if key in self.d_tagPath:
+                    try:
+                        self.d_dicom[key]       = self.d_tagPath[key].element(self.dcm)
+                        self.d_dicomSimple[key] = self.d_dicom[key].value
+                    except KeyError:
+                        self.d_dicom[key]       = None
+                        self.d_dicomSimple[key] = "no attribute"
+                    d_dicomJSON[key]        = str(self.d_dicomSimple[key])
+                    continue
+                try:
+                    self.d_dicom[key]   = self.dcm.data_element(key)
+                except KeyError:
+                    self.d_dicom[key]   = None
                 try:
                     self.d_dicomSimple[key] = getattr(self.dcm, key)
                 except:
                     self.d_dicomSimple[key] = "no attribute"
                 d_dicomJSON[key]        = str(self.d_dicomSimple[key])
 
+            if self.b_pixelStats:
+                d_stats     = self.pixelStats_find(
+                                self.d_seriesFiles.get(str_path, [str_file]))
+                for key, value in d_stats.items():
+                    self.d_dicom[key]       = '%-40s %s' % (key, value)
+                    self.d_dicomSimple[key] = value
+                    d_dicomJSON[key]        = str(value)
+                l_tagsToUse = l_tagsToUse + list(d_stats.keys())
+
             for str_outputFormat in self.l_outputFileType:
                 # pudb.set_trace()
                 if str_outputFormat == 'json':
@@ -756,6 +3047,10 @@ class pfdicom_tag(pfdicom):
                     for tag in l_tagsToUse:
                         self.str_col        += '%70s\t%s\n' % (tag , self.d_dicomSimple[tag])
                     b_formatted     = True
+                if str_outputFormat == 'dcmjson':
+                    self.str_dcmjson        = self.dicomJSON_encode(
+                                                [self.d_dicom[tag] for tag in l_tagsToUse])
+                    b_formatted     = True
                 if str_outputFormat == 'raw' or str_outputFormat == 'html':
                     for tag in l_tagsToUse:
                         if not b_rawStringAssigned:
@@ -789,33 +3084,354 @@ class pfdicom_tag(pfdicom):
                 'json':         self.str_json,
                 'dict':         self.str_dict,
                 'col':          self.str_col,
-                'raw':          self.str_raw
+                'raw':          self.str_raw,
+                'dcmjson':      self.str_dcmjson
             }
         }
 
+    def columns_update(self, a_dict):
+        """
+        Add the tags of a series (with its path and file) as a row of
+        the columnar store.
+        """
+        d_row       = {
+            'path':     a_dict['str_path'],
+            'file':     a_dict['str_inputFile']
+        }
+        d_row.update(a_dict['d_dicomSimple'])
+        return self.columns.append(d_row)
+
+    def columns_save(self):
+        """
+        Save the columnar store to '<outputFileStem>-columns.<format>'
+        (default 'columns.<format>') in the <outputDir>.
+        """
+        self.mkdir(self.str_outputDir)
+        str_stem        = self.str_outputFileStem + '-columns' if \
+                          len(self.str_outputFileStem) and \
+                          '%' not in self.str_outputFileStem else 'columns'
+        str_fileName    = os.path.join(self.str_outputDir,
+                            self.outputName_shard(str_stem + '.' + self.str_columns))
+        d_save          = self.columns.save(str_fileName, self.str_columns)
+        self.dp.qprint('Saved %d series columns: %s' % (len(self.columns),
+                                                        d_save['file']))
+        return d_save
+
+    def aggregate_update(self, a_dict, **kwargs):
+        """
+        Callback, in place of outputSave(), that folds the tags of a
+        series into the streaming aggregators.
+        """
+        dcm     = a_dict['dcm']
+        for aggregate in self.l_aggregate:
+            aggregate.update(self.tag_value(dcm, aggregate.str_tag))
+        self.aggregateSeries   += 1
+        return {
+            'status':   True
+        }
+
+    def aggregate_save(self):
+        """
+        Write the summary of all aggregators to a single JSON file in
+        the <outputDir>.
+        """
+        self.mkdir(self.str_outputDir)
+        str_stem        = self.str_outputFileStem if \
+                          len(self.str_outputFileStem) and \
+                          '%' not in self.str_outputFileStem else 'aggregate'
+        str_fileName    = os.path.join(self.str_outputDir,
+                                       self.outputName_shard(str_stem + '.json'))
+        d_summary       = {
+            'series':       self.aggregateSeries,
+            'aggregates':   [a.summary() for a in self.l_aggregate]
+        }
+        with open(str_fileName, 'w') as f:
+            f.write(json.dumps(d_summary, indent = 4))
+        self.dp.qprint('Saved aggregate summary: %s' % str_fileName)
+        return {
+            'status':   True,
+            'file':     str_fileName
+        }
+
+    def sqlite_open(self):
+        """
+        Open (or create) the SQLite tag index in the <outputDir>. The
+        'series' table holds one row per series and its key UIDs, and
+        the 'tag' table one row per extracted tag of a series.
+        """
+        self.mkdir(self.str_outputDir)
+        str_stem        = self.str_outputFileStem if \
+                          len(self.str_outputFileStem) and \
+                          '%' not in self.str_outputFileStem else 'tags'
+        str_fileName    = os.path.join(self.str_outputDir,
+                                       self.outputName_shard(str_stem + '.sqlite'))
+        self.sqlite     = sqlite3.connect(str_fileName, isolation_level = None)
+        self.sqlite.execute('PRAGMA journal_mode = WAL')
+        self.sqlite.execute('PRAGMA synchronous = NORMAL')
+        self.sqlite.execute('''
+            CREATE TABLE IF NOT EXISTS series (
+                id                  INTEGER PRIMARY KEY,
+                path                TEXT UNIQUE,
+                file                TEXT,
+                PatientID           TEXT,
+                StudyInstanceUID    TEXT,
+                SeriesInstanceUID   TEXT,
+                SOPInstanceUID      TEXT
+            )''')
+        self.sqlite.execute('''
+            CREATE TABLE IF NOT EXISTS tag (
+                series_id           INTEGER,
+                tag                 TEXT,
+                value
+            )''')
+        self.sqlite.execute('BEGIN')
+        self.sqlitePending  = 0
+        self.dp.qprint('Opened SQLite tag index: %s' % str_fileName)
+        return {
+            'status':   True,
+            'file':     str_fileName
+        }
+
+    def sqlite_insert(self, d_outputInfo):
+        """
+        Add the tags of a series to the SQLite tag index, replacing
+        any earlier rows of the same series path. Numeric tag values
+        are stored as numbers, everything else as text.
+        """
+        def value_typed(value):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            return str(value)
+
+        if self.sqlite is None:
+            self.sqlite_open()
+        dcm         = d_outputInfo['dcm']
+        str_path    = d_outputInfo['str_path']
+        l_row       = [str_path, d_outputInfo['str_inputFile']] + \
+                      [str(getattr(dcm, t, '')) for t in
+                       ['PatientID', 'StudyInstanceUID',
+                        'SeriesInstanceUID', 'SOPInstanceUID']]
+        cur         = self.sqlite.cursor()
+        cur.execute('SELECT id FROM series WHERE path = ?', (str_path,))
+        t_id        = cur.fetchone()
+        if t_id is not None:
+            cur.execute('DELETE FROM tag WHERE series_id = ?', t_id)
+            cur.execute('DELETE FROM series WHERE id = ?', t_id)
+        cur.execute('''INSERT INTO series (path, file, PatientID,
+                        StudyInstanceUID, SeriesInstanceUID, SOPInstanceUID)
+                       VALUES (?, ?, ?, ?, ?, ?)''', l_row)
+        series_id   = cur.lastrowid
+        cur.executemany('INSERT INTO tag VALUES (?, ?, ?)',
+                        [(series_id, tag, value_typed(value))
+                         for tag, value in d_outputInfo['d_dicomSimple'].items()])
+        self.sqlitePending += 1
+        if self.sqlitePending >= self.sqliteBatch:
+            self.sqlite.execute('COMMIT')
+            self.sqlite.execute('BEGIN')
+            self.sqlitePending  = 0
+        return {
+            'status':   True
+        }
+
+    def sqlite_close(self):
+        """
+        Commit the last batch, build the indexes (once, at the end
+        rather than on every insert) and close the tag index.
+        """
+        if self.sqlite is None:
+            return {'status': True}
+        self.sqlite.execute('COMMIT')
+        self.sqlite.execute('CREATE INDEX IF NOT EXISTS tag_series ON tag (series_id)')
+        self.sqlite.execute('CREATE INDEX IF NOT EXISTS tag_value ON tag (tag, value)')
+        self.sqlite.execute('CREATE INDEX IF NOT EXISTS series_uid ON series (SeriesInstanceUID)')
+        self.sqlite.execute('CREATE INDEX IF NOT EXISTS series_study ON series (StudyInstanceUID)')
+        self.sqlite.close()
+        self.sqlite     = None
+        return {
+            'status':   True
+        }
+
+    # Compressed report file suffixes and default levels
+    _d_compressSuffix   = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz', 'zstd': '.zst'}
+    _d_compressLevel    = {'gzip': 6,     'bz2': 9,      'xz': 6,     'zstd': 3}
+
+    def report_name(self, str_fileName):
+        """
+        The name <str_fileName> is written as, i.e. with the suffix
+        of the compression, if any.
+        """
+        if not len(self.str_compress):
+            return str_fileName
+        return str_fileName + self._d_compressSuffix[self.str_compress]
+
+    def report_open(self, str_fileName, str_mode = 'wt', newline = None):
+        """
+        Open the (already suffixed) report <str_fileName> for writing,
+        through a streaming compressor if one was asked for. When
+        bundling, the report becomes a member of the bundle instead.
+        """
+        if len(self.str_bundle):
+            return self.bundle_member(str_fileName, str_mode, newline)
+        return self.stream_open(str_fileName, str_mode, newline)
+
+    def stream_open(self, file, str_mode = 'wt', newline = None):
+        """
+        Open <file> (a name, or a binary file object, which is left
+        open) for writing through the compressor, if any.
+        """
+        level   = self.compressLevel
+        if level is None and len(self.str_compress):
+            level   = self._d_compressLevel[self.str_compress]
+        b_text  = 'b' not in str_mode
+        if self.str_compress == 'gzip':
+            return gzip.open(file, str_mode, compresslevel = level,
+                             newline = newline if b_text else None)
+        if self.str_compress == 'bz2':
+            return bz2.open(file, str_mode, compresslevel = level,
+                            newline = newline if b_text else None)
+        if self.str_compress == 'xz':
+            return lzma.open(file, str_mode, preset = level,
+                             newline = newline if b_text else None)
+        if self.str_compress == 'zstd':
+            return zstandard.open(file, str_mode,
+                                  cctx = zstandard.ZstdCompressor(level = level),
+                                  newline = newline if b_text else None,
+                                  closefd = isinstance(file, str))
+        return open(file, str_mode, newline = newline)
+
+    def bundle_open(self):
+        """
+        Open (for appending) the bundle of the reports in the
+        <outputDir>: a zip, or an uncompressed tar with a sidecar
+        '.index' of the member offsets, for random access.
+        """
+        self.mkdir(self.str_outputDir)
+        str_stem        = self.str_outputFileStem if \
+                          len(self.str_outputFileStem) and \
+                          '%' not in self.str_outputFileStem else 'reports'
+        self.str_bundleFile = os.path.abspath(os.path.join(self.str_outputDir,
+                                self.outputName_shard(str_stem + '.' + self.str_bundle)))
+        if self.str_bundle == 'zip':
+            self.bundle     = zipfile.ZipFile(self.str_bundleFile, 'a',
+                                compression = zipfile.ZIP_STORED if \
+                                              len(self.str_compress) else \
+                                              zipfile.ZIP_DEFLATED)
+        else:
+            self.bundle     = tarfile.open(self.str_bundleFile, 'a')
+            self.bundleIndex    = open(self.str_bundleFile + '.index', 'a')
+        self.dp.qprint('Opened report bundle: %s' % self.str_bundleFile)
+        return {
+            'status':   True,
+            'file':     self.str_bundleFile
+        }
+
+    def bundle_add(self, str_member, data):
+        """
+        Add <data> as <str_member> of the bundle.
+        """
+        if self.bundle is None:
+            self.bundle_open()
+        if self.str_bundle == 'zip':
+            self.bundle.writestr(zipfile.ZipInfo(str_member,
+                                    date_time = time.localtime()[:6]), data)
+        else:
+            info        = tarfile.TarInfo(str_member)
+            info.size   = len(data)
+            info.mtime  = int(time.time())
+            self.bundle.addfile(info, io.BytesIO(data))
+            # The data ends the archive, padded to whole blocks
+            offset_data = self.bundle.offset - \
+                          -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            self.bundleIndex.write('%s\t%d\t%d\n' % (str_member,
+                                                       offset_data,
+                                                       info.size))
+        return {
+            'status':   True
+        }
+
+    @contextlib.contextmanager
+    def bundle_member(self, str_fileName, str_mode = 'wt', newline = None,
+                      b_compress = True):
+        """
+        A file to write the report <str_fileName> into, which is added
+        to the bundle (under the current <str_bundleDir>) once closed.
+        """
+        buf         = io.BytesIO()
+        b_text      = 'b' not in str_mode
+        if b_compress and len(self.str_compress):
+            f       = self.stream_open(buf, str_mode, newline)
+        elif b_text:
+            f       = io.TextIOWrapper(buf, newline = newline)
+        else:
+            f       = buf
+        yield f
+        if b_compress and len(self.str_compress):
+            f.close()
+        elif b_text:
+            f.flush()
+            f.detach()
+        self.bundle_add(os.path.normpath(os.path.join(self.str_bundleDir,
+                                                      str_fileName)),
+                        buf.getvalue())
+
+    def bundle_close(self):
+        if self.bundle is None:
+            return {'status': True}
+        self.bundle.close()
+        self.bundle     = None
+        if self.bundleIndex is not None:
+            self.bundleIndex.close()
+            self.bundleIndex    = None
+        return {
+            'status':   True
+        }
+
     def img_create(self, dcm):
         '''
         Create the output jpg of the file.
         :return:
         '''
         b_status        = False
-        self.dp.qprint('Saving image %s...' % self.str_outputImageFile)
+        str_imageFile   = self.str_outputImageFile
+        str_format      = os.path.splitext(str_imageFile)[1].lstrip('.').lower()
+        if str_format not in ('svg', 'eps', 'ps'):
+            # The raster formats are compressed already
+            str_format  = ''
+        if len(str_format):
+            str_imageFile   = self.report_name(str_imageFile)
+        self.dlog('Saving image %s...', str_imageFile)
+        error           = None
         try:
-            pylab.imshow(dcm.pixel_array, cmap=pylab.cm.bone)
+            pylab.imshow(self.pixelArray_get(dcm), cmap=pylab.cm.bone)
             ax  = pylab.gca()
             ax.set_facecolor('#1d1f21')
             ax.tick_params(axis = 'x', colors='white')
             ax.tick_params(axis = 'y', colors='white')
-            pylab.savefig(self.str_outputImageFile, facecolor = ax.get_facecolor())
+            if len(str_format):
+                with self.report_open(str_imageFile, 'wb') as f:
+                    pylab.savefig(f, format = str_format,
+                                  facecolor = ax.get_facecolor())
+            elif len(self.str_bundle):
+                with self.bundle_member(str_imageFile, 'wb',
+                                        b_compress = False) as f:
+                    pylab.savefig(f, format = os.path.splitext(str_imageFile)[1][1:],
+                                  facecolor = ax.get_facecolor())
+            else:
+                pylab.savefig(str_imageFile, facecolor = ax.get_facecolor())
             b_status    = True
-        except:
-            pass
+        except Exception as e:
+            error       = e
         if not b_status:
-            self.dp.qprint('Some error was trapped in image creation.', comms = 'error')
+            self.dp.qprint('Error in image creation: %s' % error, comms = 'error')
         return {
-            'status':   b_status
+            'status':   b_status,
+            'error':    error,
+            'file':     str_imageFile
         }
 
+    # The result string whose size approximates each report type
+    _d_reportKey    = {'html': 'raw', 'csv': 'json'}
+
     def outputSave(self, a_dict, **kwags):
         """
         Callback for saving outputs.
@@ -823,7 +3439,7 @@ class pfdicom_tag(pfdicom):
         def html_make(str_inputFile, str_rawContent):
             str_img     = ""
             if self.b_convertToImg:
-                str_img = "<img src=%s>" % self.str_outputImageFile
+                str_img = "<img src=%s>" % str_imageFile
             htmlPage = '''
                 <!DOCTYPE html>
                 <html>
@@ -841,57 +3457,160 @@ class pfdicom_tag(pfdicom):
 
         d_outputInfo    = a_dict
         path            = d_outputInfo['str_path']
+        if 'sqlite' in self.l_outputFileType:
+            self.sqlite_insert(d_outputInfo)
+            if self.l_outputFileType == ['sqlite'] and not self.b_convertToImg:
+                # Nothing is written per series
+                if self.b_printToScreen:
+                    print(d_outputInfo['dstr_result']['raw'])
+                return {
+                    'status':   True
+                }
         str_cwd         = os.getcwd()
-        self.mkdir(self.str_outputDir)
-        self.dp.qprint("Generating report for record: %s" % path)
-        os.chdir(self.str_outputDir)
-        self.mkdir(path)
-        os.chdir(path)
+        self.dlog("Generating report for record: %s", path)
+        if len(self.str_bundle):
+            # Reports go into the bundle, so nothing is created on disk
+            self.str_bundleDir  = path
+        else:
+            self.mkdir(self.str_outputDir)
+            os.chdir(self.str_outputDir)
+            self.mkdir(path)
+            os.chdir(path)
         if self.b_printToScreen:
             print(d_outputInfo['dstr_result']['raw'])
+        if self.throttle is not None:
+            self.throttle.acquire(
+                files   = len(self.l_outputFileType),
+                bytes   = sum(len(d_outputInfo['dstr_result'].get(
+                                    self._d_reportKey.get(f, f), ''))
+                              for f in self.l_outputFileType))
+        str_imageFile   = self.str_outputImageFile
         if self.b_convertToImg:
-            self.img_create(d_outputInfo['dcm'])
+            d_img   = self.img_create(d_outputInfo['dcm'])
+            str_imageFile   = d_img['file']
+            if not d_img['status']:
+                # The other outputs are still written
+                self.quarantine_add(path, d_outputInfo['str_inputFile'],
+                                    'img_create', d_img['error'])
         for str_outputFormat in self.l_outputFileType:
             if str_outputFormat == 'json': 
-                str_fileName = d_outputInfo['str_outputFile']+'.json' 
-                with open(str_fileName, 'w') as f:
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'.json')
+                with self.report_open(str_fileName) as f:
                     f.write(d_outputInfo['dstr_result']['json'])
-                self.dp.qprint('Saved report file: %s' % str_fileName)
+                self.dlog('Saved report file: %s', str_fileName)
             if str_outputFormat == 'dict': 
-                str_fileName = d_outputInfo['str_outputFile']+'-dict.txt' 
-                with open(str_fileName, 'w') as f:
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'-dict.txt')
+                with self.report_open(str_fileName) as f:
                     f.write(d_outputInfo['dstr_result']['dict'])
-                self.dp.qprint('Saved report file: %s' % str_fileName)
+                self.dlog('Saved report file: %s', str_fileName)
             if str_outputFormat == 'col': 
-                str_fileName = d_outputInfo['str_outputFile']+'-col.txt' 
-                with open(str_fileName, 'w') as f:
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'-col.txt')
+                with self.report_open(str_fileName) as f:
                     f.write(d_outputInfo['dstr_result']['col'])
-                self.dp.qprint('Saved report file: %s' % str_fileName)
+                self.dlog('Saved report file: %s', str_fileName)
             if str_outputFormat == 'raw': 
-                str_fileName = d_outputInfo['str_outputFile']+'-raw.txt' 
-                with open(str_fileName, 'w') as f:
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'-raw.txt')
+                with self.report_open(str_fileName) as f:
                     f.write(d_outputInfo['dstr_result']['raw'])
-                self.dp.qprint('Saved report file: %s' % str_fileName)
+                self.dlog('Saved report file: %s', str_fileName)
             if str_outputFormat == 'html': 
-                str_fileName = d_outputInfo['str_outputFile']+'.html' 
-                with open(str_fileName, 'w') as f:
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'.html')
+                with self.report_open(str_fileName) as f:
                     f.write(
                         html_make(  d_outputInfo['str_inputFile'],
                                     d_outputInfo['dstr_result']['raw'])
                     )
-                self.dp.qprint('Saved report file: %s' % str_fileName)
+                self.dlog('Saved report file: %s', str_fileName)
+            if str_outputFormat == 'dcmjson':
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'-dcm.json')
+                with self.report_open(str_fileName) as f:
+                    f.write(d_outputInfo['dstr_result']['dcmjson'])
+                self.dlog('Saved report file: %s', str_fileName)
             if str_outputFormat == 'csv':
-                str_fileName = d_outputInfo['str_outputFile']+'-csv.txt' 
-                with open(str_fileName, 'w') as f:
+                str_fileName = self.report_name(d_outputInfo['str_outputFile']+'-csv.txt')
+                with self.report_open(str_fileName, newline = '') as f:
                     w = csv.DictWriter(f, d_outputInfo['d_dicomJSON'].keys())
                     w.writeheader()
                     w.writerow(d_outputInfo['d_dicomJSON'])
-                self.dp.qprint('Saved report file: %s' % str_fileName)
+                self.dlog('Saved report file: %s', str_fileName)
         os.chdir(str_cwd)
         return {
             'status':   True
         }
 
+    @classmethod
+    def iter_series(cls, inputDir, tags = None, **kwargs):
+        """
+        Library entry point: walk <inputDir> and lazily yield one
+        record per series
+
+            {
+                'path': <series directory, relative to <inputDir>>,
+                'file': <name of the file examined in the series>,
+                'tags': {<tag>: <value>, ...}
+            }
+
+        as the tree is walked. <tags> is an optional list (or comma
+        separated string) of tags to extract -- by default all tags
+        are returned. Any other constructor **kwargs (extension,
+        where, shard, sniff, mmap, ...) apply as for run().
+
+        Unlike run(), no report files are written and the process
+        working directory is never changed, so this can be used
+        inside a long-lived process.
+        """
+        if tags:
+            if not isinstance(tags, str):
+                tags                = ','.join(tags)
+            kwargs['tagList']       = tags
+        kwargs.setdefault('verbosity', -1)
+        pf_dicomtag = cls(inputDir = inputDir, **kwargs)
+        yield from pf_dicomtag.series_iterate()
+
+    def series_iterate(self):
+        """
+        Generator behind iter_series(): yield a tag record per
+        series of <inputDir>.
+        """
+        str_topDir      = self.str_inputDir
+        if os.path.isfile(self.str_inputDir):
+            if not self.archive_open(self.str_inputDir)['status']:
+                self.fatal('inputArchiveFail')
+            str_topDir  = '.'
+
+        pf_tree         = pftree(
+                            inputDir                = str_topDir,
+                            inputFile               = self.str_inputFile,
+                            shardIndex              = self.shardIndex,
+                            shardCount              = self.shardCount,
+                            archiveMembers          = list(self.d_archiveMember.keys()) \
+                                                      if self.archive is not None else None,
+                            fileFilter              = self.file_admit if self.b_sniff else None,
+                            progress                = self.progress_get(),
+                            verbosity               = self.verbosityLevel
+        )
+        try:
+            for str_path, l_file in pf_tree.tree_walk(root = str_topDir):
+                if len(self.str_extension):
+                    l_file  = [x for x in l_file if self.str_extension in x]
+                    if not l_file:
+                        continue
+                if self.b_pixelStats:
+                    self.d_seriesFiles  = {os.path.dirname(l_file[0]): l_file}
+                l_file      = self.filelist_prune(l_file)['l_file']
+                if self.query and not self.where_match(l_file):
+                    continue
+                d_tags      = self.tagsFindOnFile(l_file)
+                yield {
+                    'path':     os.path.relpath(str_path, str_topDir),
+                    'file':     d_tags['str_inputFile'],
+                    'tags':     d_tags['d_dicomSimple']
+                }
+        finally:
+            if self.archive is not None:
+                self.archive.close()
+                self.archive    = None
+
     def run(self):
         '''
         The main 'engine' of the class.
@@ -900,40 +3619,736 @@ class pfdicom_tag(pfdicom):
         we parse a DICOM input for the tag info. Tags are kept 
         in a dictionary structure that mimics the <inputDir>
         hierarchy.
+
+        If the <inputDir> is in fact a zip or tar archive, then the
+        archive members are treated as the (virtual) input tree.
         
         '''
 
-        os.chdir(self.str_inputDir)
+        pf_tree         = self.tree_build()
         str_cwd         = os.getcwd()
+        str_quarantine  = os.path.join(self.str_outputDir,
+                                       self.outputName_shard('quarantine.jsonl'))
+        if os.path.isfile(str_quarantine):
+            # Left over from an earlier run
+            os.remove(str_quarantine)
+        self.tree_process(pf_tree)
+        if self.shardCount > 1:
+            self.shardIndex_save(pf_tree.d_inputTree)
+        if self.archive is not None:
+            self.archive.close()
+            self.archive    = None
+        os.chdir(str_cwd)
+
+    def tree_build(self):
+        """
+        Open the input (directory or archive), change into it, and
+        walk it into a (sharded) pftree of the series.
+        """
+        if os.path.isfile(self.str_inputDir):
+            str_archive = os.path.abspath(self.str_inputDir)
+            if not self.archive_open(str_archive)['status']:
+                self.fatal('inputArchiveFail')
+            os.chdir(os.path.dirname(str_archive))
+        else:
+            os.chdir(self.str_inputDir)
 
         pf_tree         = pftree(
                             inputDir                = self.str_inputDir,
                             inputFile               = self.str_inputFile,
                             outputDir               = self.str_outputDir,
+                            shardIndex              = self.shardIndex,
+                            shardCount              = self.shardCount,
+                            archiveMembers          = list(self.d_archiveMember.keys()) \
+                                                      if self.archive is not None else None,
+                            fileFilter              = self.file_admit if self.b_sniff else None,
+                            progress                = self.progress_get(),
                             verbosity               = self.verbosityLevel
         )
 
-        pudb.set_trace()
-
+        if len(self.str_fileList):
+            d_read      = pf_tree.tree_read(files = self.fileList_read())
+            self.dp.qprint('Read %d files in %d directories from the file list' % \
+                            (d_read['files'], d_read['dirs']))
+            return pf_tree
         d_probe         = pf_tree.tree_probe(       
                             root                    = "."
         )
         d_construct     = pf_tree.tree_construct(   
                             l_files                 = d_probe['l_files']
         )
+        return pf_tree
+
+    def fileList_read(self):
+        """
+        Generate the paths of the <fileList> (or stdin, for '-'), as
+        paths relative to the input directory in the './<dir>/<file>'
+        form of the walk. The list is newline separated, or NUL
+        separated (as from 'find -print0') if a NUL is seen. Relative
+        paths are taken relative to the input directory; absolute
+        paths must lie within it, and others are skipped, since their
+        reports would land outside the output directory.
+        """
+        str_root        = os.path.abspath(self.str_inputDir)
+        if os.path.isfile(str_root):
+            # The list names archive members
+            str_root    = os.path.dirname(str_root)
+        str_rootSlash   = str_root.rstrip('/') + '/'
+        d_outside       = {'files': 0}
+
+        def file_normalize(line):
+            str_file    = os.fsdecode(line.rstrip(b'\r'))
+            if not len(str_file):
+                return None
+            if str_file[0] == '/':
+                if not str_file.startswith(str_rootSlash):
+                    d_outside['files'] += 1
+                    return None
+                str_file    = str_file[len(str_rootSlash):]
+            str_file    = os.path.normpath(str_file)
+            if str_file == '..' or str_file.startswith('../'):
+                d_outside['files'] += 1
+                return None
+            return './' + str_file
+
+        try:
+            if self.str_fileList == '-':
+                fp      = contextlib.nullcontext(sys.stdin.buffer)
+            else:
+                fp      = open(self.str_fileList, 'rb')
+        except OSError:
+            self.fatal('fileListFail')
+        with fp as fp:
+            separator   = None
+            tail        = b''
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                if separator is None:
+                    separator   = b'\0' if b'\0' in chunk else b'\n'
+                l_line  = (tail + chunk).split(separator)
+                tail    = l_line.pop()
+                for line in l_line:
+                    str_file    = file_normalize(line)
+                    if str_file is not None:
+                        yield str_file
+            str_file    = file_normalize(tail)
+            if str_file is not None:
+                yield str_file
+        if d_outside['files']:
+            self.dp.qprint('Skipped %d files outside of %s' % \
+                            (d_outside['files'], str_root),
+                           comms = 'error')
+
+    def series_cost(self, al_file):
+        """
+        The cost model of a series: the total bytes of its files.
+        """
+        return sum(self.file_size(f) for f in al_file)
+
+    def plan(self):
+        """
+        Walk the input tree without processing it, and return a plan
+        of the run: the series, file and byte counts, and an estimate
+        of the runtime. The estimate is calibrated by timing the file
+        selection and tag extraction (without writing any output) on
+        <planSample> series spread over the tree, fitting a linear
+        cost in the bytes read per series, and applying it to every
+        series. The largest series are listed too.
+        """
+        pf_tree         = self.tree_build()
+        str_cwd         = os.getcwd()
+        d_series        = {}
+        for path, l_file in pf_tree.d_inputTree.items():
+            if len(self.str_extension):
+                l_file  = [x for x in l_file if self.str_extension in x]
+            if len(l_file):
+                d_series[path]  = (l_file, self.series_cost(l_file))
+        files           = sum(len(l) for l, b in d_series.values())
+        bytes           = sum(b for l, b in d_series.values())
+
+        def feature(path):
+            # The bytes a series' processing reads: all its files for
+            # pixel statistics, otherwise about one file
+            l_file, b   = d_series[path]
+            return b if self.b_pixelStats else b / len(l_file)
+
+        l_path          = list(d_series.keys())
+        l_sample        = l_path[::max(1, len(l_path) // max(1, self.planSample))] \
+                          [:self.planSample]
+        l_x, l_t        = [], []
+        for path in l_sample:
+            f_start     = time.time()
+            try:
+                l_file  = self.filelist_prune(d_series[path][0])['l_file']
+                self.d_seriesFiles  = {path: d_series[path][0]}
+                self.tagsFindOnFile(l_file)
+            except Exception as e:
+                self.dp.qprint('Plan sample %s failed: %s' % (path, e),
+                               comms = 'error')
+                continue
+            l_t.append(time.time() - f_start)
+            l_x.append(feature(path))
+
+        f_fixed, f_perByte      = (float(np.mean(l_t)) if l_t else 0.0), 0.0
+        if len(set(l_x)) > 1:
+            f_perByte, f_fixed  = np.polyfit(l_x, l_t, 1)
+            if f_perByte < 0 or f_fixed < 0:
+                f_fixed, f_perByte  = float(np.mean(l_t)), 0.0
+        d_estimate      = {path: f_fixed + f_perByte * feature(path)
+                           for path in l_path}
+        l_largest       = sorted(l_path, key = lambda p: d_series[p][1],
+                                 reverse = True)[:5]
+        if self.archive is not None:
+            self.archive.close()
+            self.archive    = None
+        os.chdir(str_cwd)
+        return {
+            'status':               True,
+            'series':               len(l_path),
+            'files':                files,
+            'bytes':                bytes,
+            'sampled':              len(l_t),
+            'sampleSeconds':        sum(l_t),
+            'secondsPerSeries':     sum(d_estimate.values()) / len(l_path) \
+                                    if len(l_path) else 0.0,
+            'estimatedSeconds':     sum(d_estimate.values()),
+            'largestSeries':        [{
+                                        'path':     p,
+                                        'files':    len(d_series[p][0]),
+                                        'bytes':    d_series[p][1],
+                                        'seconds':  d_estimate[p]
+                                    } for p in l_largest]
+        }
+
+    # FS_IOC_FIEMAP, from linux/fs.h
+    _FIEMAP = 0xC020660B
+
+    def file_location(self, str_file):
+        """
+        A sort key for the on-disk location of <str_file>, following
+        <str_order>: the inode number, or the physical offset of the
+        first extent (via the FIEMAP ioctl, falling back to the inode
+        where that is not supported). For archive inputs, the offset
+        of the member in the archive.
+        """
+        if self.archive is not None:
+            info    = self.d_archiveMember.get(
+                        self.archiveMember_normalize(str_file))
+            if isinstance(info, zipfile.ZipInfo):
+                return (0, info.header_offset)
+            if info is not None:
+                return (0, info.offset_data)
+            return (1, 0)
+        try:
+            if self.str_order == 'extent':
+                with open(str_file, 'rb') as fp:
+                    buf     = bytearray(struct.pack('QQIIII', 0,
+                                        0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+                                        + bytes(56))
+                    fcntl.ioctl(fp.fileno(), self._FIEMAP, buf)
+                    if struct.unpack_from('I', buf, 20)[0]:
+                        return (0, struct.unpack_from('Q', buf, 40)[0])
+            return (1, os.stat(str_file).st_ino)
+        except OSError:
+            return (2, 0)
+
+    @staticmethod
+    def location_span(l_location):
+        """
+        The total distance travelled when visiting the <l_location>
+        in order -- a proxy for the seeking done by the reads.
+        """
+        return sum(abs(b[1] - a[1]) for a, b in zip(l_location, l_location[1:])
+                   if a[0] == b[0])
+
+    def tree_order(self, pf_tree):
+        """
+        Reorder the series in the <pf_tree> input tree (and so their
+        processing) by the on-disk location of their selected file,
+        turning scattered reads across directories into mostly
+        sequential ones.
+        """
+        d_location  = {path: self.file_location(l_file[0])
+                       for path, l_file in pf_tree.d_inputTree.items()}
+        l_path      = sorted(d_location, key = lambda p: d_location[p])
+        spanWalk    = self.location_span(list(d_location.values()))
+        spanOrder   = self.location_span([d_location[p] for p in l_path])
+        pf_tree.d_inputTree = {p: pf_tree.d_inputTree[p] for p in l_path}
+        self.dp.qprint('Ordered %d series by %s: seek span %d -> %d' % \
+                        (len(l_path), self.str_order, spanWalk, spanOrder))
+        return {
+            'status':       True,
+            'spanWalk':     spanWalk,
+            'spanOrder':    spanOrder
+        }
+
+    # The errno values of read errors worth retrying, typically seen
+    # on network filesystems
+    _s_errnoTransient = frozenset([
+        errno.EIO, errno.EAGAIN, errno.EINTR, errno.EBUSY,
+        errno.ETIMEDOUT, errno.ESTALE, errno.ECONNRESET
+    ])
+
+    def timeout_call(self, fn_callback, *args, **kwargs):
+        """
+        Call <fn_callback>, raising a TimeoutError if it does not
+        return within <timeout> seconds. The timer is a SIGALRM, so it
+        only applies in the main thread of a process (which includes
+        the workers of pfdicomtag_server).
+        """
+        if self.timeout <= 0 or not hasattr(signal, 'setitimer') or \
+           threading.current_thread() is not threading.main_thread():
+            return fn_callback(*args, **kwargs)
+
+        def alarm_handle(signum, frame):
+            raise TimeoutError('no result after %g seconds' % self.timeout)
+
+        fn_previous = signal.signal(signal.SIGALRM, alarm_handle)
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        try:
+            return fn_callback(*args, **kwargs)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, fn_previous)
+
+    def quarantine_add(self, str_path, str_file, str_stage, e, attempts = 1):
+        """
+        Record a series that failed, and append it as a JSON line to
+        the quarantine file in the <outputDir>, so that the list
+        survives even if the run itself does not complete.
+        """
+        d_entry     = {
+            'path':     str_path,
+            'file':     str_file,
+            'stage':    str_stage,
+            'error':    type(e).__name__,
+            'message':  str(e),
+            'attempts': attempts
+        }
+        self.l_quarantine.append(d_entry)
+        self.dp.qprint('Quarantined %s (%s: %s)' % (str_path, type(e).__name__, e),
+                        comms = 'error')
+        self.mkdir(self.str_outputDir)
+        str_mode    = 'a'
+        if not len(self.str_quarantineFile):
+            self.str_quarantineFile = os.path.join(self.str_outputDir,
+                                        self.outputName_shard('quarantine.jsonl'))
+            str_mode    = 'w'
+        with open(self.str_quarantineFile, str_mode) as f:
+            f.write(json.dumps(d_entry) + '\n')
+        return d_entry
+
+    def series_isolate(self, fn_callback, failValue):
+        """
+        Wrap a per-series tree callback so that an exception in it
+        quarantines the series instead of aborting the run: the
+        callback returns <failValue>, and the output stage then skips
+        the series. Transient read errors are retried <retries> times
+        with exponential backoff, and every call is subject to the
+        <timeout>.
+        """
+        @functools.wraps(fn_callback)
+        def fn_isolated(*args, **kwargs):
+            if args and isinstance(args[0], dict) and args[0].get('quarantined'):
+                return {'status': False}
+            attempts    = 0
+            while True:
+                attempts   += 1
+                try:
+                    return self.timeout_call(fn_callback, *args, **kwargs)
+                except Exception as e:
+                    if isinstance(e, OSError) and not isinstance(e, TimeoutError) \
+                       and e.errno in self._s_errnoTransient \
+                       and attempts <= self.retries:
+                        time.sleep(self.retryBackoff * 2 ** (attempts - 1))
+                        continue
+                    if args and isinstance(args[0], dict):
+                        str_path    = args[0].get('str_path', '')
+                        str_file    = args[0].get('str_inputFile', '')
+                    else:
+                        str_file    = args[0][0] if args and len(args[0]) else ''
+                        str_path    = os.path.dirname(str_file)
+                        str_file    = os.path.basename(str_file)
+                    self.quarantine_add(str_path, str_file,
+                                        fn_callback.__name__, e, attempts)
+                    return failValue
+        return fn_isolated
+
+    def progress_get(self):
+        """
+        The progress reporter of this object, created on first use.
+        """
+        if self.progress is None:
+            self.progress   = pfprogress(verbosity = self.verbosityLevel)
+        return self.progress
+
+    def tree_process(self, pf_tree):
+        """
+        Select the file of each series in the <pf_tree> input tree,
+        extract its tags and generate the outputs (or fold them into
+        the aggregators).
+        """
+        if self.b_pixelStats:
+            # The statistics cover every file of a series, not just the
+            # one file the tree is pruned to
+            self.d_seriesFiles  = {os.path.dirname(l[0]): list(l)
+                                   for l in pf_tree.d_inputTree.values()}
+        if self.str_order == 'size':
+            # Largest series first, so that a huge (e.g. multi-frame)
+            # series does not start last and make the tail of the run
+            d_cost  = {p: self.series_cost(l) for p, l in pf_tree.d_inputTree.items()}
+            pf_tree.d_inputTree = {p: pf_tree.d_inputTree[p] for p in
+                                   sorted(d_cost, key = d_cost.get, reverse = True)}
         d_inputAnalysis = pf_tree.tree_analysisApply(
                             analysiscallback        = self.filelist_prune,
                             applyResultsTo          = 'inputTree',
                             applyKey                = 'l_file',
                             persistAnalysisResults  = True
         )
-        d_tagsExtract   = pf_tree.tree_analysisApply(
-                            analysiscallback        = self.tagsFindOnFile,
-                            outputcallback          = self.outputSave,
-                            persistAnalysisResults  = False
+        for path in [p for p, l in pf_tree.d_inputTree.items() if not len(l)]:
+            # No file of this directory passed the <extension> filter
+            del pf_tree.d_inputTree[path]
+        d_order     = {}
+        if self.str_order in ('inode', 'extent'):
+            d_order = self.tree_order(pf_tree)
+        fn_outputcallback   = self.outputSave
+        if len(self.l_aggregate):
+            # Aggregation replaces the per-series reports, and only
+            # needs the aggregated tags extracted.
+            fn_outputcallback   = self.aggregate_update
+            self.l_outputFileType   = []
+            if not (self.b_tagList or self.b_tagFile):
+                self.b_tagList      = True
+                self.l_tag          = list(dict.fromkeys(
+                                        a.str_tag for a in self.l_aggregate))
+        if self.columns is not None:
+            fn_outputSeries     = fn_outputcallback
+
+            def fn_outputcallback(a_dict, **kwargs):
+                self.columns_update(a_dict)
+                return fn_outputSeries(a_dict, **kwargs)
+        fn_outputcallback   = self.series_isolate(fn_outputcallback,
+                                              {'status': False})
+        fn_analysiscallback = self.series_isolate(self.tagsFindOnFile,
+                                              {'status': False, 'quarantined': True})
+        fn_filtercallback   = self.series_isolate(self.where_match, False) \
+                              if self.query else None
+        pf_prefetch         = None
+        if self.prefetchAhead > 0 and self.archive is None:
+            # The filter, if any, is the first to touch each series
+            # file; otherwise the analysis is.
+            pf_prefetch     = pfprefetch(
+                                files   = [l[0] for l in pf_tree.d_inputTree.values()],
+                                ahead   = self.prefetchAhead,
+                                bytes   = 0 if self.pixelData_needed() else \
+                                          self.prefetchBytes
+                              ).start()
+            if fn_filtercallback:
+                fn_filtercallback   = pf_prefetch.wrap(fn_filtercallback)
+            else:
+                fn_analysiscallback = pf_prefetch.wrap(fn_analysiscallback)
+        f_start         = time.time()
+        try:
+            d_tagsExtract   = pf_tree.tree_analysisApply(
+                                analysiscallback        = fn_analysiscallback,
+                                outputcallback          = fn_outputcallback,
+                                filtercallback          = fn_filtercallback,
+                                persistAnalysisResults  = False
+            )
+        finally:
+            if pf_prefetch is not None:
+                pf_prefetch.stop()
+        if self.query:
+            self.dp.qprint("Series not matching where clause: %d" % \
+                            d_tagsExtract['filtered'])
+        f_elapsed       = time.time() - f_start
+        seriesCount     = len(pf_tree.d_inputTree) - d_tagsExtract['filtered']
+        self.dp.qprint("Extracted %d series in %.2f s (%.1f series/s, order %s)" % \
+                        (seriesCount, f_elapsed,
+                         seriesCount / f_elapsed if f_elapsed else 0,
+                         self.str_order))
+        self.mmap_close()
+        if self.throttle is not None:
+            self.dp.qprint(self.throttle.summary())
+        if len(self.l_aggregate):
+            self.aggregate_save()
+        self.sqlite_close()
+        self.bundle_close()
+        if self.columns is not None:
+            self.columns_save()
+        if len(self.l_quarantine):
+            self.dp.qprint("Series quarantined: %d (see %s)" % \
+                            (len(self.l_quarantine), self.str_quarantineFile),
+                            comms = 'error')
+        return {
+            'status':   True,
+            'series':   len(pf_tree.d_inputTree),
+            'filtered': d_tagsExtract['filtered'],
+            'quarantined':  len(self.l_quarantine),
+            'elapsed':  f_elapsed,
+            'order':    d_order
+        }
+
+    def watch(self):
+        '''
+        Perform an initial run(), and then keep watching the <inputDir>
+        for new or modified series directories. Once a directory has
+        been quiet for <watchQuiet> seconds (so that series still
+        being written are not reported early), only that directory
+        is processed.
+
+        Directory changes are detected with inotify where available,
+        and otherwise by polling directory modification times every
+        <watchPoll> seconds.
+        '''
+        self.run()
+        if self.archive is not None or os.path.isfile(self.str_inputDir):
+            return {'status': True}
+
+        pf_watch        = pfwatch(
+                            root                    = '.',
+                            poll                    = self.watchPoll,
+                            verbosity               = self.verbosityLevel
         )
+        d_dirty         = {}
+        try:
+            while True:
+                for str_dir in pf_watch.changes_wait(self.watchPoll):
+                    d_dirty[str_dir]    = time.time()
+                f_now       = time.time()
+                l_ready     = [d for d, t in d_dirty.items()
+                               if f_now - t >= self.watchQuiet]
+                if not l_ready:
+                    continue
+                pf_tree     = pftree(
+                                inputDir                = self.str_inputDir,
+                                inputFile               = self.str_inputFile,
+                                outputDir               = self.str_outputDir,
+                                shardIndex              = self.shardIndex,
+                                shardCount              = self.shardCount,
+                                fileFilter              = self.file_admit if self.b_sniff else None,
+                                progress                = self.progress_get(),
+                                verbosity               = self.verbosityLevel
+                )
+                l_files     = []
+                for str_dir in l_ready:
+                    del d_dirty[str_dir]
+                    try:
+                        l_name  = [f.name for f in os.scandir(str_dir) if f.is_file()]
+                    except OSError:
+                        continue
+                    l_filesHere = pf_tree.files_filter(str_dir, l_name)
+                    if len(self.str_extension):
+                        l_filesHere = [f for f in l_filesHere
+                                       if self.str_extension in f]
+                    if l_filesHere:
+                        l_files.append(l_filesHere)
+                pf_tree.tree_construct(l_files = l_files)
+                self.dp.qprint('Processing %d changed series' % \
+                                len(pf_tree.d_inputTree))
+                if len(pf_tree.d_inputTree):
+                    self.tree_process(pf_tree)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pf_watch.close()
+        return {
+            'status':   True
+        }
+
+
+def pfdicomtag_job(d_job):
+    """
+    Run one pfdicom_tag job described by the constructor **kwargs in
+    <d_job>, and return a summary of the result. This is the unit of
+    work of the pfdicomtag_server pool.
+
+    The working directory of the (re-used) pool process is restored
+    after the job, since pfdicom_tag.run() changes into the input
+    directory.
+    """
+    str_cwd     = os.getcwd()
+    d_result    = {
+        'status':       False,
+        'inputDir':     d_job.get('inputDir', ''),
+        'outputDir':    '',
+        'elapsed':      0.0
+    }
+    try:
+        pf_dicomtag = pfdicom_tag(**d_job)
+        pf_dicomtag.tic()
+        pf_dicomtag.run()
+        d_result['outputDir']   = os.path.abspath(pf_dicomtag.str_outputDir)
+        d_result['quarantined'] = pf_dicomtag.l_quarantine
+        d_result['elapsed']     = pf_dicomtag.toc()
+        d_result['status']      = True
+    except SystemExit as e:
+        d_result['exitCode']    = e.code
+    except Exception as e:
+        d_result['error']       = '%s: %s' % (type(e).__name__, e)
+    finally:
         os.chdir(str_cwd)
+    return d_result
+
+def pfdicomtag_client(str_address, **kwargs):
+    """
+    A minimal client for a pfdicomtag_server listening on
+    <str_address> (see pfdicomtag_server). The **kwargs are the
+    pfdicom_tag constructor options of the job; the server's result
+    dictionary is returned.
+
+    Paths that the server would otherwise resolve against its own
+    working directory are made absolute here.
+    """
+    for str_key in ['inputDir', 'tagFile']:
+        if len(kwargs.get(str_key, '') or ''):
+            kwargs[str_key] = os.path.abspath(kwargs[str_key])
+    str_job     = json.dumps(kwargs)
+    if str_address.startswith('unix:'):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str_address[len('unix:'):])
+            sock.sendall(str_job.encode('utf-8') + b'\n')
+            with sock.makefile('rb') as f:
+                return json.loads(f.readline().decode('utf-8'))
+    if not str_address.startswith('http'):
+        str_address = 'http://' + str_address
+    request     = urllib.request.Request(
+                    str_address.rstrip('/') + '/job',
+                    data    = str_job.encode('utf-8'),
+                    headers = {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def pfdicomtag_reportOpen(str_fileName, str_mode = 'rt'):
+    """
+    Open a report written by pfdicom_tag for reading, transparently
+    decompressing it if it was written with --compress (recognized
+    by the file suffix).
+    """
+    if str_fileName.endswith('.gz'):
+        return gzip.open(str_fileName, str_mode)
+    if str_fileName.endswith('.bz2'):
+        return bz2.open(str_fileName, str_mode)
+    if str_fileName.endswith('.xz'):
+        return lzma.open(str_fileName, str_mode)
+    if str_fileName.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('reading .zst reports needs the zstandard module')
+        return zstandard.open(str_fileName, str_mode)
+    return open(str_fileName, str_mode)
+
+class pfdicomtag_server(object):
+    """
+    A long running server that keeps the interpreter, pydicom,
+    matplotlib, numpy and pfmisc warm, and runs pfdicom_tag jobs on a
+    pool of (forked, and hence equally warm) worker processes.
+
+    The <address> is either
+
+        unix:/path/to/socket    -- one JSON job per line, answered
+                                   with one JSON result per line
+        [host]:port             -- HTTP, with a JSON job POSTed to
+                                   /job and a JSON result returned
+
+    A job is a JSON object of pfdicom_tag constructor options (the
+    same as the command line of bin/pfdicomtag), and the result is
+    that of pfdicomtag_job(). See pfdicomtag_client() for a client.
+    """
+
+    def __init__(self, **kwargs):
+        self.str_address        = 'localhost:8000'
+        self.workers            = os.cpu_count() or 1
+        self.verbosityLevel     = -1
+        self.__name__           = 'pfdicomtag_server'
+        self.server             = None
+        self.pool               = None
+
+        for key, value in kwargs.items():
+            if key == 'address':        self.str_address    = value
+            if key == 'workers':        self.workers        = int(value)
+            if key == 'verbosity':      self.verbosityLevel = int(value)
+
+        self.dp                 = pfmisc.debug(
+                                    verbosity   = self.verbosityLevel,
+                                    level       = 0,
+                                    within      = self.__name__
+                                    )
 
+    def job_submit(self, d_job):
+        """
+        Run <d_job> on the pool and wait for its result.
+        """
+        self.dp.qprint('Job received: %s' % d_job.get('inputDir', ''))
+        d_result    = self.pool.submit(pfdicomtag_job, d_job).result()
+        self.dp.qprint('Job done: %s (%s)' % (d_result['inputDir'],
+                                              d_result['status']))
+        return d_result
+
+    def serve(self):
+        """
+        Serve jobs until interrupted.
+        """
+        pf_server   = self
+
+        class unixHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for str_line in self.rfile:
+                    if not str_line.strip():
+                        continue
+                    try:
+                        d_result = pf_server.job_submit(json.loads(str_line))
+                    except ValueError as e:
+                        d_result = {'status': False, 'error': str(e)}
+                    self.wfile.write(json.dumps(d_result).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        class httpHandler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.rstrip('/') != '/job':
+                    self.send_error(404)
+                    return
+                length  = int(self.headers.get('Content-Length', 0))
+                try:
+                    d_result    = pf_server.job_submit(
+                                    json.loads(self.rfile.read(length)))
+                except ValueError as e:
+                    d_result    = {'status': False, 'error': str(e)}
+                str_body        = json.dumps(d_result).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(str_body)))
+                self.end_headers()
+                self.wfile.write(str_body)
+
+            def log_message(self, *args):
+                pass
+
+        self.pool   = concurrent.futures.ProcessPoolExecutor(
+                        max_workers = self.workers)
+        if self.str_address.startswith('unix:'):
+            str_socket  = self.str_address[len('unix:'):]
+            if os.path.exists(str_socket):
+                os.remove(str_socket)
+            self.server = socketserver.ThreadingUnixStreamServer(
+                            str_socket, unixHandler)
+        else:
+            str_host, str_port  = self.str_address.replace('http://', '').rsplit(':', 1)
+            self.server = http.server.ThreadingHTTPServer(
+                            (str_host or 'localhost', int(str_port)), httpHandler)
+        self.dp.qprint('Serving on %s with %d workers' % (self.str_address,
+                                                           self.workers))
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.pool.shutdown()
+            if self.str_address.startswith('unix:') and \
+               os.path.exists(self.str_address[len('unix:'):]):
+                os.remove(self.str_address[len('unix:'):])
+        return {
+            'status':   True
+        }
 
 class pfdicomtag(object):
 
@@ -0,0 +1,88 @@
+import os
+import shutil
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import pytest
+import pydicom
+
+from pfdicomtag.pfdicomtag import pfdicom_tag
+
+
+TEST_FILES  = os.path.join(os.path.dirname(pydicom.__file__), 'data', 'test_files')
+
+
+def sample_path(str_name):
+    return os.path.join(TEST_FILES, str_name)
+
+
+def series_write(str_dir, str_source, count, **kwargs):
+    """
+    Write <count> copies of the pydicom test file <str_source> into
+    <str_dir>, as slices of one series. The file names run in the
+    reverse of the slice order, so that name order and slice order
+    differ.
+    """
+    os.makedirs(str_dir, exist_ok = True)
+    ds              = pydicom.dcmread(sample_path(str_source))
+    uid             = pydicom.uid.generate_uid()
+    for i in range(count):
+        ds.SeriesInstanceUID    = uid
+        ds.SOPInstanceUID       = pydicom.uid.generate_uid()
+        if 'ImagePositionPatient' in ds:
+            ds.InstanceNumber       = i + 1
+            ds.ImagePositionPatient = [0, 0, float(i)]
+        for key, value in kwargs.items():
+            setattr(ds, key, value)
+        ds.save_as(os.path.join(str_dir, 'img%02d.dcm' % (count - 1 - i)))
+
+
+@pytest.fixture(autouse = True)
+def cwd_restore():
+    # run() changes into the input tree
+    str_cwd     = os.getcwd()
+    yield
+    os.chdir(str_cwd)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    An input tree of three series:
+
+        s1      5 CT slices (PatientID P1)
+        s2      3 MR slices (PatientID P2)
+        a/s3    1 RT plan, which has no image (PatientID P3)
+    """
+    str_root    = str(tmp_path / 'in')
+    series_write(os.path.join(str_root, 's1'), 'CT_small.dcm', 5, PatientID = 'P1')
+    series_write(os.path.join(str_root, 's2'), 'MR_small.dcm', 3, PatientID = 'P2')
+    series_write(os.path.join(str_root, 'a', 's3'), 'rtplan.dcm', 1, PatientID = 'P3')
+    return str_root
+
+
+@pytest.fixture
+def outdir(tmp_path):
+    return str(tmp_path / 'out')
+
+
+def tag_run(inputDir, outputDir, **kwargs):
+    """
+    Run pfdicom_tag quietly over <inputDir>, and return the object.
+    """
+    kwargs.setdefault('outputFileStem', 'x')
+    kwargs.setdefault('outputFileType', 'json')
+    pf_dicomtag     = pfdicom_tag(inputDir  = inputDir,
+                                  outputDir = outputDir,
+                                  verbosity = -1,
+                                  **kwargs)
+    pf_dicomtag.run()
+    return pf_dicomtag
+
+
+def outputs(str_dir):
+    """
+    The files under <str_dir>, relative to it.
+    """
+    return sorted(os.path.relpath(os.path.join(root, f), str_dir)
+                  for root, dirs, files in os.walk(str_dir) for f in files)
@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+from pfdicomtag.pfdicomtag import pfdicom_tag, aggregate_histogram, \
+                                  aggregate_topK, aggregate_distinct
+from conftest import tag_run, outputs
+
+
+def test_aggregate_run(tree, outdir):
+    tag_run(tree, outdir,
+            outputFileStem  = 'cohort',
+            aggregate       = 'count:Modality,hist:Rows:0:512:4,distinct:PatientID')
+    # Only the summary is written, no per-series reports
+    assert outputs(outdir) == ['cohort.json']
+    with open(os.path.join(outdir, 'cohort.json')) as f:
+        d_summary   = json.load(f)
+    assert d_summary['series'] == 3
+    d_count, d_hist, d_distinct = d_summary['aggregates']
+    assert d_count['counts'] == {'CT': 1, 'MR': 1, 'RTPLAN': 1}
+    assert d_hist['counts'] == [1, 1, 0, 0]
+    assert d_hist['missing'] == 1
+    assert d_hist['edges'] == [0, 128, 256, 384, 512]
+    assert d_distinct['distinct'] == 3
+
+
+@pytest.mark.parametrize('str_spec', [
+    'hist:Rows:0:512:0',
+    'hist:Rows:10:10:4',
+    'hist:Rows:20:10:4',
+    'hist:Rows:a:b',
+    'median:Rows',
+])
+def test_bad_aggregate_is_fatal(str_spec):
+    with pytest.raises(SystemExit) as e:
+        pfdicom_tag(aggregate = str_spec, verbosity = -1)
+    assert e.value.code == 50
+
+
+def test_histogram_ages():
+    hist    = aggregate_histogram('PatientAge', 0, 100, 10)
+    for value in ('034Y', '006M', '104Y', None, ''):
+        hist.update(value)
+    d       = hist.summary()
+    assert d['counts'][3] == 1 and d['counts'][0] == 1
+    assert (d['overflow'], d['missing']) == (1, 2)
+
+
+def test_topk_finds_heavy_hitters():
+    topk    = aggregate_topK('x', 3)
+    for i in range(1000):
+        topk.update('a' if i % 2 else str(i))
+    assert topk.summary()['top'][0]['value'] == 'a'
+
+
+def test_distinct_estimate():
+    distinct    = aggregate_distinct('x')
+    for i in range(5000):
+        distinct.update(i % 2000)
+    assert abs(distinct.summary()['distinct'] - 2000) < 200
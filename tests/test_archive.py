@@ -0,0 +1,52 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from pfdicomtag.pfdicomtag import pftree
+from conftest import tag_run, outputs
+
+
+def tar_write(str_archive, str_root, l_dir, mode = 'w:gz'):
+    with tarfile.open(str_archive, mode) as tar:
+        for str_dir in l_dir:
+            for str_file in sorted(os.listdir(os.path.join(str_root, str_dir))):
+                tar.add(os.path.join(str_root, str_dir, str_file),
+                        arcname = os.path.join(str_dir, str_file))
+
+
+@pytest.mark.parametrize('mode', ['w', 'w:gz'])
+def test_tar_input_mirrors_members(tree, outdir, tmp_path, mode):
+    str_archive = str(tmp_path / 'in.tar')
+    tar_write(str_archive, tree, ['s1', 's2', 'a/s3'], mode)
+    tag_run(str_archive, outdir)
+    assert outputs(outdir) == ['a/s3/x.json', 's1/x.json', 's2/x.json']
+
+
+def test_zip_input(tree, outdir, tmp_path):
+    str_archive = str(tmp_path / 'in.zip')
+    with zipfile.ZipFile(str_archive, 'w') as z:
+        for root, dirs, files in os.walk(tree):
+            for f in files:
+                z.write(os.path.join(root, f),
+                        os.path.relpath(os.path.join(root, f), tree))
+    tag_run(str_archive, outdir)
+    assert outputs(outdir) == ['a/s3/x.json', 's1/x.json', 's2/x.json']
+
+
+def test_empty_archive_does_not_walk_its_directory(tree, outdir, tmp_path):
+    # The archive sits next to a directory of DICOM files, which must
+    # not be picked up
+    str_archive = os.path.join(os.path.dirname(tree), 'empty.tar')
+    tarfile.open(str_archive, 'w').close()
+    tag_run(str_archive, outdir)
+    assert outputs(outdir) == []
+
+
+def test_archive_walk_follows_archive_order():
+    pf_tree = pftree(archiveMembers = ['s2/b', 's2/a', 'x/s1/a', 's0/a'],
+                     verbosity = -1)
+    l_walk  = [(root, files) for root, dirs, files in pf_tree.archive_walk('.')
+               if files]
+    assert l_walk == [('./s2', ['b', 'a']), ('./x/s1', ['a']), ('./s0', ['a'])]
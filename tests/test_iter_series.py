@@ -0,0 +1,26 @@
+import os
+
+from pfdicomtag.pfdicomtag import pfdicom_tag
+
+
+def test_iter_series_yields_records(tree):
+    str_cwd     = os.getcwd()
+    d_record    = {r['path']: r for r in
+                   pfdicom_tag.iter_series(tree, tags = ['PatientID', 'Modality'])}
+    # No files are written, and the working directory is left alone
+    assert os.getcwd() == str_cwd
+    assert sorted(d_record) == ['a/s3', 's1', 's2']
+    assert d_record['s1']['tags'] == {'PatientID': 'P1', 'Modality': 'CT'}
+    assert d_record['s2']['file'].endswith('.dcm')
+
+
+def test_iter_series_is_lazy(tree):
+    it_series   = pfdicom_tag.iter_series(tree, tags = 'PatientID')
+    assert 'tags' in next(it_series)
+
+
+def test_iter_series_options(tree):
+    l_path      = [r['path'] for r in
+                   pfdicom_tag.iter_series(tree, tags = 'Modality',
+                                           where = "Modality == 'MR'")]
+    assert l_path == ['s2']
@@ -0,0 +1,51 @@
+import json
+import os
+
+import numpy as np
+import pydicom
+
+from pfdicomtag.pfdicomtag import pfdicom_tag
+from conftest import tag_run, sample_path
+
+
+def test_mmap_reports_match(tree, outdir):
+    tag_run(tree, outdir + '0')
+    tag_run(tree, outdir + '1', mmap = True)
+    for str_series in ('s1', 's2', 'a/s3'):
+        with open(os.path.join(outdir + '0', str_series, 'x.json')) as f0, \
+             open(os.path.join(outdir + '1', str_series, 'x.json')) as f1:
+            assert json.load(f0) == json.load(f1)
+
+
+def test_pixel_view_matches_pixel_array():
+    pf_dicomtag = pfdicom_tag(mmap = True, verbosity = -1)
+    pf_dicomtag.DICOMfile_read(file = sample_path('CT_small.dcm'))
+    arr         = pf_dicomtag.pixelArray_view(pf_dicomtag.dcm)
+    assert arr is not None
+    assert np.array_equal(arr, pydicom.dcmread(sample_path('CT_small.dcm')).pixel_array)
+
+
+def test_signed_short_stored_falls_back(tmp_path):
+    # 12 of 16 bits stored, signed: 0x0FFF is -1
+    ds                  = pydicom.dcmread(sample_path('CT_small.dcm'))
+    ds.BitsStored       = 12
+    ds.HighBit          = 11
+    ds.PixelRepresentation = 1
+    arr                 = np.full((ds.Rows, ds.Columns), 0x0FFF, dtype = '<u2')
+    ds.PixelData        = arr.tobytes()
+    str_file            = str(tmp_path / 'signed12.dcm')
+    ds.save_as(str_file)
+
+    pf_dicomtag = pfdicom_tag(mmap = True, verbosity = -1)
+    pf_dicomtag.DICOMfile_read(file = str_file)
+    assert pf_dicomtag.pixelArray_view(pf_dicomtag.dcm) is None
+    assert np.array_equal(pf_dicomtag.pixelArray_get(pf_dicomtag.dcm),
+                          pydicom.dcmread(str_file).pixel_array)
+
+
+def test_previous_map_is_closed():
+    pf_dicomtag = pfdicom_tag(mmap = True, verbosity = -1)
+    pf_dicomtag.DICOMfile_read(file = sample_path('CT_small.dcm'))
+    first       = pf_dicomtag.mmap
+    pf_dicomtag.DICOMfile_read(file = sample_path('MR_small.dcm'))
+    assert first.closed
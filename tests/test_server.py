@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pfdicomtag.pfdicomtag import pfdicomtag_server, pfdicomtag_client, \
+                                  pfdicomtag_job
+from conftest import outputs
+
+
+def test_job(tree, outdir):
+    str_cwd     = os.getcwd()
+    d_result    = pfdicomtag_job({'inputDir': tree, 'outputDir': outdir,
+                                  'outputFileStem': 'x', 'outputFileType': 'json'})
+    assert d_result['status']
+    assert os.getcwd() == str_cwd
+    assert outputs(outdir) == ['a/s3/x.json', 's1/x.json', 's2/x.json']
+
+
+def test_job_reports_fatal_errors(tree):
+    d_result    = pfdicomtag_job({'inputDir': tree, 'shard': '9/2'})
+    assert not d_result['status'] and d_result['exitCode'] == 30
+
+
+@pytest.fixture
+def server(tmp_path):
+    str_address = 'unix:' + str(tmp_path / 'pfdicomtag.sock')
+    pf_server   = pfdicomtag_server(address = str_address, workers = 1)
+    thread      = threading.Thread(target = pf_server.serve, daemon = True)
+    thread.start()
+    for i in range(100):
+        if os.path.exists(str(tmp_path / 'pfdicomtag.sock')):
+            break
+        time.sleep(0.05)
+    yield str_address
+    pf_server.server.shutdown()
+    thread.join()
+
+
+def test_client_server(server, tree, outdir):
+    for i in range(2):
+        d_result    = pfdicomtag_client(server,
+                                        inputDir        = tree,
+                                        outputDir       = outdir + str(i),
+                                        outputFileStem  = 'x',
+                                        outputFileType  = 'json',
+                                        verbosity       = -1)
+        assert d_result['status'], d_result
+    assert outputs(outdir + '1') == ['a/s3/x.json', 's1/x.json', 's2/x.json']
@@ -0,0 +1,44 @@
+import json
+import os
+
+import pytest
+
+from pfdicomtag.pfdicomtag import pfdicom_tag, pftree
+from conftest import tag_run, outputs
+
+
+def test_shards_partition_the_series(tree, outdir):
+    l_seen  = []
+    for index in range(3):
+        tag_run(tree, outdir + str(index), shard = '%d/3' % index)
+        l_seen += [os.path.dirname(f) for f in outputs(outdir + str(index))
+                   if f.endswith('x.json')]
+    assert sorted(l_seen) == ['a/s3', 's1', 's2']
+
+
+def test_shard_of_is_stable():
+    assert pftree.shard_of('./s1', 7) == pftree.shard_of('s1', 7)
+
+
+@pytest.mark.parametrize('d_env, str_shard', [
+    ({'PFDICOMTAG_SHARD': '2/5'},                               '2/5'),
+    ({'SLURM_ARRAY_TASK_ID': '3', 'SLURM_ARRAY_TASK_COUNT': '4',
+      'SLURM_ARRAY_TASK_MIN': '1'},                             '2/4'),
+    ({'SLURM_ARRAY_TASK_ID': '10', 'SLURM_ARRAY_TASK_COUNT': '6',
+      'SLURM_ARRAY_TASK_MIN': '0', 'SLURM_ARRAY_TASK_STEP': '2'}, '5/6'),
+    ({'SGE_TASK_ID': '5', 'SGE_TASK_FIRST': '1', 'SGE_TASK_LAST': '9',
+      'SGE_TASK_STEPSIZE': '2'},                                '2/5'),
+])
+def test_shard_from_environment(monkeypatch, tree, d_env, str_shard):
+    for key in ('PFDICOMTAG_SHARD', 'SLURM_ARRAY_TASK_ID', 'SGE_TASK_ID'):
+        monkeypatch.delenv(key, raising = False)
+    for key, value in d_env.items():
+        monkeypatch.setenv(key, value)
+    pf_dicomtag = pfdicom_tag(inputDir = tree, verbosity = -1)
+    assert '%d/%d' % (pf_dicomtag.shardIndex, pf_dicomtag.shardCount) == str_shard
+
+
+def test_bad_shard_is_fatal(tree):
+    with pytest.raises(SystemExit) as e:
+        pfdicom_tag(inputDir = tree, shard = '3/3', verbosity = -1)
+    assert e.value.code == 30
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+import pydicom
+
+from pfdicomtag.pfdicomtag import pfdicom_tag
+from conftest import tag_run, outputs, sample_path
+
+
+@pytest.mark.parametrize('str_name, b_dicom', [
+    ('CT_small.dcm',                True),
+    ('ExplVR_LitEndNoMeta.dcm',     True),
+    ('ExplVR_BigEndNoMeta.dcm',     True),
+    ('README.txt',                  False),
+    ('rtplan.dump',                 False),
+])
+def test_sniff(str_name, b_dicom):
+    pf_dicomtag = pfdicom_tag(verbosity = -1)
+    assert pf_dicomtag.DICOMfile_sniff(sample_path(str_name)) == b_dicom
+
+
+def test_sniff_skips_other_files(tree, outdir):
+    with open(os.path.join(tree, 's1', 'README'), 'w') as f:
+        f.write('not a DICOM file\n')
+    os.makedirs(os.path.join(tree, 'notes'))
+    with open(os.path.join(tree, 'notes', 'todo.txt'), 'w') as f:
+        f.write('nor this\n')
+    # An old style file, without the preamble and file meta
+    ds              = pydicom.dcmread(sample_path('CT_small.dcm'))
+    ds.preamble     = None
+    del ds.file_meta
+    ds.is_implicit_VR   = True
+    ds.is_little_endian = True
+    ds.save_as(os.path.join(tree, 'nometa'), write_like_original = True)
+    tag_run(tree, outdir, sniff = True)
+    assert outputs(outdir) == ['a/s3/x.json', 's1/x.json', 's2/x.json',
+                               'x.json']
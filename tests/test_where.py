@@ -0,0 +1,41 @@
+import pydicom
+import pytest
+
+from pfdicomtag.pfdicomtag import pfdicom_tag, pfquery
+from conftest import tag_run, outputs, sample_path
+
+
+@pytest.fixture
+def ct():
+    return pydicom.dcmread(sample_path('CT_small.dcm'))
+
+
+@pytest.mark.parametrize('str_where, b_match', [
+    ("Modality == 'CT'",                                True),
+    ("Modality != 'CT'",                                False),
+    ("Rows >= 128 and Columns < 129",                   True),
+    ("Rows > 128 or Modality ~ '^C'",                   True),
+    ("not (Modality == 'CT')",                          False),
+    ("PixelSpacing < 0.7",                              True),
+    ("EchoTime > 1",                                    False),
+])
+def test_query(ct, str_where, b_match):
+    assert pfquery(str_where).match(ct) == b_match
+
+
+def test_query_tags():
+    assert set(pfquery("Modality == 'CT' and Rows > 1").l_tag) == \
+           {'Modality', 'Rows'}
+
+
+@pytest.mark.parametrize('str_where', ["Modality ==", "(Rows > 1", "Rows @ 1",
+                                       "NoSuchTag == 1"])
+def test_bad_clause_is_fatal(str_where):
+    with pytest.raises(SystemExit) as e:
+        pfdicom_tag(where = str_where, verbosity = -1)
+    assert e.value.code == 40
+
+
+def test_where_filters_series(tree, outdir):
+    tag_run(tree, outdir, where = "Modality == 'MR' or PatientID == 'P3'")
+    assert outputs(outdir) == ['a/s3/x.json', 's2/x.json']